@@ -1,20 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from contextlib import asynccontextmanager
+from typing import Annotated, Optional
 import os
-from datetime import datetime
+import time
+import asyncio
+import multiprocessing
+from datetime import datetime, timezone
+import orjson
 from dotenv import load_dotenv
 
-from .models.database import get_db, create_tables
+from .models.database import get_db, get_read_db, open_read_session, create_tables, SessionLocal
 from .models.pydantic_models import (
     UserMessage, ConversationResponse, IdentityVerificationRequest,
-    PaymentRequest, EscalationRequest, HealthCheck, ErrorResponse
+    PaymentRequest, EscalationRequest, HealthCheck,
+    TwilioWebhook, StripeWebhook
 )
 from .services.conversation_service import conversation_service
-from .services.rag_service import rag_service
-from .utils.logging_config import setup_logging, get_logger
+from .services.rag_service import get_rag_service
+from .services.llm_service import get_llm_service
+from .utils.logging_config import (
+    setup_logging, get_logger, start_log_listeners, stop_log_listeners
+)
+from .utils.background_events import enqueue_event, start_event_workers, stop_event_workers
 
 # Load environment variables
 load_dotenv()
@@ -27,22 +40,101 @@ setup_logging(
 
 logger = get_logger(__name__)
 
+# Session dependencies, resolved once per request and shared by sub-dependencies
+DbSession = Annotated[AsyncSession, Depends(get_db)]
+ReadDbSession = Annotated[AsyncSession, Depends(get_read_db)]
+
+API_VERSION = "1.0.0"
+
+# /converse returns its pre-encoded body, skipping FastAPI's response_model
+# re-validation and jsonable_encoder pass
+CONVERSE_FAST_PATH = os.getenv("CONVERSE_FAST_PATH", "true").lower() == "true"
+
+# Interactive docs and the OpenAPI schema are not exposed in production
+DOCS_ENABLED = os.getenv("ENV", "dev") != "prod"
+
+# Static ErrorResponse fields for the global exception handler
+_ERROR_TEMPLATE = {
+    "error": "Internal Server Error",
+    "message": "An unexpected error occurred. Please try again later."
+}
+
+# Recent /health result as (monotonic timestamp, HealthCheck) so probe bursts
+# don't each hit the database and RAG index
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "2"))
+_health_cache = None
+
+# Set by prepare_workers() for the worker processes it precedes
+STORAGE_INITIALIZED_ENV = "APP_STORAGE_INITIALIZED"
+
+
+async def _initialize_storage():
+    """Create the tables and seed the default RAG documents"""
+    await create_tables()
+    
+    # Failing to build the RAG service stops startup; the default
+    # documents are best-effort
+    rag_service = get_rag_service()
+    try:
+        rag_service.initialize_default_documents()
+        logger.info("RAG service initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize RAG service: {e}")
+
+
+def _initialize_storage_once():
+    start_log_listeners()
+    try:
+        asyncio.run(_initialize_storage())
+        get_rag_service().flush()
+    finally:
+        stop_log_listeners()
+
+
+def prepare_workers():
+    """
+    Create the schema and seed the default documents once, before starting
+    several worker processes, so their startups do not race on CREATE TABLE
+    or insert the same documents
+    
+    Runs in a short-lived child process, so the serving supervisor does not
+    keep the embedding model loaded.
+    """
+    process = multiprocessing.get_context("spawn").Process(target=_initialize_storage_once)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise SystemExit(f"Storage initialization failed (exit code {process.exitcode})")
+    os.environ[STORAGE_INITIALIZED_ENV] = "1"
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
+    start_log_listeners()
     logger.info("Starting Debt Recovery Agent API...")
     
-    # Create database tables
-    create_tables()
+    start_event_workers()
     
-    # Initialize RAG service with default documents
+    # Load the RAG service in this worker before taking traffic. Tables and
+    # default documents are set up here unless prepare_workers() already
+    # did it for all workers.
+    if os.getenv(STORAGE_INITIALIZED_ENV) == "1":
+        get_rag_service()
+    else:
+        await _initialize_storage()
+    
+    # Build the LLM service in this worker before taking traffic, so the
+    # first conversation turn does not pay for it
     try:
-        rag_service.initialize_default_documents()
-        logger.info("RAG service initialized successfully")
+        get_llm_service()
     except Exception as e:
-        logger.error(f"Failed to initialize RAG service: {e}")
+        logger.error(f"Failed to initialize LLM service: {e}")
+    
+    # Serialize the OpenAPI schema once; /openapi.json serves these bytes
+    if DOCS_ENABLED:
+        app.state.openapi_bytes = orjson.dumps(app.openapi())
     
     logger.info("Application startup complete")
     
@@ -50,23 +142,40 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Debt Recovery Agent API...")
+    
+    await stop_event_workers(timeout=5)
+    
+    # Persist vector index changes still waiting on the debounced save
+    get_rag_service().flush()
+    
+    stop_log_listeners()
 
 
 # Create FastAPI app
 app = FastAPI(
     title="AI Debt Recovery Agent",
     description="An AI-first debt recovery system with compliance and safety features",
-    version="1.0.0",
-    lifespan=lifespan
+    version=API_VERSION,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+    # Served by the prebuilt routes below instead of FastAPI's defaults
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None
 )
 
-# Add CORS middleware
+# Add CORS middleware with an explicit allowlist so preflight responses are static
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=[
+        origin.strip()
+        for origin in os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:3000").split(",")
+        if origin.strip()
+    ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,
 )
 
 
@@ -75,13 +184,14 @@ async def global_exception_handler(request, exc):
     """Global exception handler for better error responses"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
-        content=ErrorResponse(
-            error="Internal Server Error",
-            message="An unexpected error occurred. Please try again later.",
-            details={"type": type(exc).__name__}
-        ).dict()
+        # Same shape as ErrorResponse, built directly since orjson encodes the datetime
+        content={
+            **_ERROR_TEMPLATE,
+            "details": {"type": type(exc).__name__},
+            "timestamp": datetime.now(timezone.utc)
+        }
     )
 
 
@@ -90,7 +200,7 @@ async def root():
     """Root endpoint"""
     return {
         "message": "AI Debt Recovery Agent API",
-        "version": "1.0.0",
+        "version": API_VERSION,
         "status": "operational"
     }
 
@@ -98,41 +208,60 @@ async def root():
 @app.get("/health", response_model=HealthCheck)
 async def health_check():
     """Health check endpoint"""
+    global _health_cache
+    if _health_cache and time.monotonic() - _health_cache[0] < HEALTH_CACHE_TTL:
+        return _health_cache[1]
+    
     try:
         # Check database connection
-        db = next(get_db())
-        db.execute("SELECT 1")
+        async with SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         db_status = "healthy"
-        db.close()
     except Exception as e:
         logger.error(f"Database health check failed: {e}")
         db_status = "unhealthy"
     
-    # Check RAG service
-    try:
-        rag_service.search("test query", top_k=1)
-        rag_status = "healthy"
-    except Exception as e:
-        logger.error(f"RAG service health check failed: {e}")
-        rag_status = "unhealthy"
+    # Check RAG service readiness without running an embedding pass
+    rag_status = "healthy" if get_rag_service().is_ready() else "unhealthy"
     
-    return HealthCheck(
+    # Internally generated, so skip validation
+    health = HealthCheck.model_construct(
         status="healthy" if db_status == "healthy" and rag_status == "healthy" else "degraded",
-        timestamp=datetime.utcnow(),
-        version="1.0.0",
+        timestamp=datetime.now(timezone.utc),
+        version=API_VERSION,
         dependencies={
             "database": db_status,
             "rag_service": rag_status,
             "llm_service": "healthy"  # Assume healthy if no immediate errors
         }
     )
+    
+    _health_cache = (time.monotonic(), health)
+    return health
+
+
+@app.get("/health/deep", response_model=HealthCheck)
+async def deep_health_check():
+    """Deep health check that exercises a real RAG search (not for LB probes)"""
+    health = await health_check()
+    
+    # search() logs and swallows its own errors, so judge by the result;
+    # embedding and search are blocking, so they run off the event loop
+    rag_status = "healthy" if await asyncio.to_thread(get_rag_service().check_health) else "unhealthy"
+    
+    dependencies = {**health.dependencies, "rag_service": rag_status}
+    return HealthCheck.model_construct(
+        status="healthy" if all(v == "healthy" for v in dependencies.values()) else "degraded",
+        timestamp=datetime.now(timezone.utc),
+        version=API_VERSION,
+        dependencies=dependencies
+    )
 
 
 @app.post("/converse", response_model=ConversationResponse)
 async def converse(
     message: UserMessage,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """
     Main conversation endpoint for debt recovery interactions
@@ -144,7 +273,7 @@ async def converse(
     - Compliance checking
     """
     try:
-        logger.info(f"Processing conversation for loan_id: {message.loan_id}")
+        logger.debug("Processing conversation for loan_id: %s", message.loan_id)
         
         # Process the conversation
         response = await conversation_service.process_message(
@@ -156,22 +285,28 @@ async def converse(
             db=db
         )
         
-        # Log conversation event in background
-        background_tasks.add_task(
-            conversation_service.log_conversation_event,
-            response.conversation_id,
-            "user_message",
-            message.user_text,
-            message.metadata
+        # Log both sides of the turn as a single background event
+        enqueue_event(
+            conversation_service.log_conversation_events,
+            [
+                {
+                    "conversation_id": response.conversation_id,
+                    "message_type": "user_message",
+                    "content": message.user_text,
+                    "metadata": message.metadata.model_dump(exclude_none=True) if message.metadata else None
+                },
+                {
+                    "conversation_id": response.conversation_id,
+                    "message_type": "assistant_response",
+                    "content": response.assistant.message_to_user,
+                    "metadata": response.assistant.model_dump()
+                }
+            ]
         )
         
-        background_tasks.add_task(
-            conversation_service.log_conversation_event,
-            response.conversation_id,
-            "assistant_response",
-            response.assistant.message_to_user,
-            response.assistant.dict()
-        )
+        if CONVERSE_FAST_PATH:
+            # The response is already a validated model; encode it once in pydantic-core
+            return Response(content=response.model_dump_json(), media_type="application/json")
         
         return response
         
@@ -186,7 +321,7 @@ async def converse(
 @app.post("/verify-identity")
 async def verify_identity(
     request: IdentityVerificationRequest,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """
     Identity verification endpoint
@@ -194,7 +329,7 @@ async def verify_identity(
     Verifies borrower identity using provided data points
     """
     try:
-        logger.info(f"Processing identity verification for conversation: {request.conversation_id}")
+        logger.debug("Processing identity verification for conversation: %s", request.conversation_id)
         
         result = await conversation_service.verify_identity(
             conversation_id=request.conversation_id,
@@ -219,8 +354,7 @@ async def verify_identity(
 @app.post("/process-payment")
 async def process_payment(
     request: PaymentRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """
     Payment processing endpoint
@@ -228,7 +362,7 @@ async def process_payment(
     Handles payment collection and processing
     """
     try:
-        logger.info(f"Processing payment for loan_id: {request.loan_id}")
+        logger.debug("Processing payment for loan_id: %s", request.loan_id)
         
         result = await conversation_service.process_payment(
             loan_id=request.loan_id,
@@ -240,7 +374,7 @@ async def process_payment(
         )
         
         # Log payment event in background
-        background_tasks.add_task(
+        enqueue_event(
             conversation_service.log_payment_event,
             request.loan_id,
             request.amount,
@@ -262,14 +396,13 @@ async def process_payment(
 @app.post("/escalate")
 async def escalate_conversation(
     request: EscalationRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """
     Escalation endpoint for human agent handoff
     """
     try:
-        logger.info(f"Escalating conversation: {request.conversation_id}")
+        logger.debug("Escalating conversation: %s", request.conversation_id)
         
         result = await conversation_service.escalate_to_human(
             conversation_id=request.conversation_id,
@@ -280,7 +413,7 @@ async def escalate_conversation(
         )
         
         # Log escalation event in background
-        background_tasks.add_task(
+        enqueue_event(
             conversation_service.log_escalation_event,
             request.conversation_id,
             request.reason,
@@ -298,18 +431,82 @@ async def escalate_conversation(
         raise HTTPException(status_code=500, detail="Escalation failed")
 
 
+async def _stream_conversation(header: dict, db: AsyncSession, limit: int,
+                               before_id: Optional[int]):
+    """Yield the conversation document as orjson chunks, one per message batch"""
+    yield orjson.dumps(header)[:-1] + b',"messages":['
+    
+    count = 0
+    oldest_id = None
+    error = None
+    separator = b""
+    try:
+        async for batch in conversation_service.iter_messages(
+            header["conversation"]["id"], db, limit=limit, before_id=before_id
+        ):
+            if batch:
+                if oldest_id is None:
+                    oldest_id = batch[0]["id"]
+                count += len(batch)
+                yield separator + orjson.dumps(batch)[1:-1]
+                separator = b","
+    except Exception as e:
+        # The 200 is already sent: end the document with the error so the
+        # body stays valid JSON, and no cursor past a partial page
+        logger.error(f"Error streaming conversation {header['conversation']['conversation_id']}: {e}")
+        error = "Failed to retrieve conversation"
+    
+    next_before_id = oldest_id if count == limit and not error else None
+    tail = b'],"next_before_id":' + orjson.dumps(next_before_id)
+    if error:
+        tail += b',"error":' + orjson.dumps(error)
+    yield tail + b"}"
+
+
 @app.get("/conversation/{conversation_id}")
 async def get_conversation(
     conversation_id: str,
-    db: Session = Depends(get_db)
+    db: ReadDbSession,
+    stream: bool = True,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 200,
+    before_id: Optional[int] = None
 ):
-    """Get conversation details and history"""
+    """
+    Get conversation details and history
+    
+    Returns the most recent `limit` messages (older than `before_id` when
+    given) in chronological order; `next_before_id` is the cursor for the
+    previous page, or null when there is none. The page is streamed in
+    batches by default; pass stream=false for a single buffered response.
+    """
     try:
-        conversation = await conversation_service.get_conversation(conversation_id, db)
-        if not conversation:
+        if not stream:
+            conversation = await conversation_service.get_conversation(
+                conversation_id, db, limit=limit, before_id=before_id
+            )
+            if not conversation:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            
+            return conversation
+        
+        # The header and the messages are read in one read-only transaction,
+        # on a session that outlives the request scope and is closed once
+        # the body is sent (or the client goes away)
+        stream_db = await open_read_session()
+        try:
+            header = await conversation_service.get_conversation_header(conversation_id, stream_db)
+        except BaseException:
+            await stream_db.close()
+            raise
+        if not header:
+            await stream_db.close()
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        return conversation
+        return StreamingResponse(
+            _stream_conversation(header, stream_db, limit, before_id),
+            media_type="application/json",
+            background=BackgroundTask(stream_db.close)
+        )
         
     except HTTPException:
         raise
@@ -321,7 +518,7 @@ async def get_conversation(
 @app.get("/loan/{loan_id}/conversations")
 async def get_loan_conversations(
     loan_id: int,
-    db: Session = Depends(get_db)
+    db: ReadDbSession
 ):
     """Get all conversations for a specific loan"""
     try:
@@ -335,17 +532,17 @@ async def get_loan_conversations(
 
 @app.post("/webhook/twilio")
 async def twilio_webhook(
-    request: dict,
+    request: TwilioWebhook,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """Webhook endpoint for Twilio SMS integration"""
     try:
         logger.info("Processing Twilio webhook")
         
         # Extract message details
-        from_number = request.get("From", "")
-        message_body = request.get("Body", "")
+        from_number = request.From
+        message_body = request.Body
         
         # Find associated loan/borrower by phone number
         # This would need to be implemented based on your phone number lookup logic
@@ -362,24 +559,24 @@ async def twilio_webhook(
 
 @app.post("/webhook/stripe")
 async def stripe_webhook(
-    request: dict,
+    request: StripeWebhook,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: DbSession
 ):
     """Webhook endpoint for Stripe payment events"""
     try:
         logger.info("Processing Stripe webhook")
         
-        event_type = request.get("type", "")
+        event_type = request.type
         
         if event_type == "payment_intent.succeeded":
             # Handle successful payment
-            payment_data = request.get("data", {}).get("object", {})
+            payment_data = request.data.object
             # Implementation would go here
             
         elif event_type == "payment_intent.payment_failed":
             # Handle failed payment
-            payment_data = request.get("data", {}).get("object", {})
+            payment_data = request.data.object
             # Implementation would go here
         
         return {"status": "received"}
@@ -391,9 +588,9 @@ async def stripe_webhook(
 
 @app.get("/analytics/conversations")
 async def get_conversation_analytics(
+    db: ReadDbSession,
     start_date: str = None,
-    end_date: str = None,
-    db: Session = Depends(get_db)
+    end_date: str = None
 ):
     """Get conversation analytics and metrics"""
     try:
@@ -411,9 +608,9 @@ async def get_conversation_analytics(
 
 @app.get("/analytics/collections")
 async def get_collection_analytics(
+    db: ReadDbSession,
     start_date: str = None,
-    end_date: str = None,
-    db: Session = Depends(get_db)
+    end_date: str = None
 ):
     """Get collection performance analytics"""
     try:
@@ -433,7 +630,7 @@ async def get_collection_analytics(
 async def rebuild_rag_index(background_tasks: BackgroundTasks):
     """Admin endpoint to rebuild the RAG index"""
     try:
-        background_tasks.add_task(rag_service.rebuild_index)
+        background_tasks.add_task(get_rag_service().rebuild_index)
         return {"message": "RAG index rebuild started"}
         
     except Exception as e:
@@ -441,16 +638,37 @@ async def rebuild_rag_index(background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail="Failed to start index rebuild")
 
 
+if DOCS_ENABLED:
+    @app.get("/openapi.json", include_in_schema=False)
+    async def openapi_schema():
+        """Serve the OpenAPI schema serialized at startup"""
+        return Response(content=app.state.openapi_bytes, media_type="application/json")
+    
+    @app.get("/docs", include_in_schema=False)
+    async def swagger_ui():
+        return get_swagger_ui_html(openapi_url="/openapi.json", title=f"{app.title} - Swagger UI")
+    
+    @app.get("/redoc", include_in_schema=False)
+    async def redoc():
+        return get_redoc_html(openapi_url="/openapi.json", title=f"{app.title} - ReDoc")
+
+
 if __name__ == "__main__":
     import uvicorn
     
     port = int(os.getenv("PORT", "8000"))
     host = os.getenv("HOST", "0.0.0.0")
+    workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+    if workers > 1:
+        prepare_workers()
     
     uvicorn.run(
         "app.main:app",
         host=host,
         port=port,
-        reload=True,
-        log_level="info"
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        log_level="warning",
+        access_log=False
     )
@@ -0,0 +1,92 @@
+import msgspec
+from typing import Any, Optional, List, Dict, Tuple
+from datetime import datetime
+
+
+# Internal models built in tight loops by the services. They are never
+# parsed from client input, so they use msgspec structs instead of Pydantic.
+
+class MessageInfo(msgspec.Struct, kw_only=True):
+    id: int
+    message_type: str
+    content: str
+    confidence_score: Optional[float] = None
+    created_at: datetime
+
+
+class MessageTurn(msgspec.Struct, kw_only=True, frozen=True):
+    """One message of the recent-history window handed to the LLM"""
+    role: str
+    content: str
+    created_at: datetime
+
+
+# RAG search results, built once per retrieved chunk
+class RAGResult(msgspec.Struct, kw_only=True, frozen=True):
+    document_id: str
+    content: str
+    score: float
+    metadata: Dict[str, Any]
+    document_type: str
+
+
+class RAGResponse(msgspec.Struct, kw_only=True, frozen=True):
+    results: List[RAGResult]
+    total_results: int
+    query_time: float
+
+
+# Compliance Models. Frozen so shared instances can be reused safely;
+# ComplianceCheck holds only scalars, so it can opt out of GC tracking.
+class ComplianceCheck(msgspec.Struct, kw_only=True, frozen=True, gc=False):
+    check_name: str
+    passed: bool
+    details: Optional[str] = None
+    severity: str = "info"  # info, warning, error, critical
+
+
+class ContactDecision(msgspec.Struct, kw_only=True, frozen=True):
+    allowed: bool
+    reason: Optional[str] = None
+    checks: Tuple[ComplianceCheck, ...] = ()
+
+
+class ComplianceReport(msgspec.Struct, kw_only=True, frozen=True):
+    conversation_id: str
+    checks: List[ComplianceCheck]
+    overall_status: str  # passed, warning, failed
+    requires_human_review: bool = False
+    timestamp: datetime
+
+
+# Analytics Models
+class ConversationMetrics(msgspec.Struct, kw_only=True):
+    total_conversations: int
+    active_conversations: int
+    escalated_conversations: int
+    resolution_rate: float
+    average_resolution_time: float
+    channel_breakdown: Dict[str, int]
+
+
+class CollectionMetrics(msgspec.Struct, kw_only=True):
+    total_amount_collected: float
+    number_of_payments: int
+    payment_plan_acceptance_rate: float
+    settlement_rate: float
+    average_days_to_resolution: float
+
+
+class LLMMetrics(msgspec.Struct, kw_only=True):
+    total_api_calls: int
+    total_tokens_used: int
+    average_response_time: float
+    total_cost: float
+    confidence_score_distribution: Dict[str, int]
+
+
+__all__ = [
+    "MessageInfo", "MessageTurn", "RAGResult", "RAGResponse",
+    "ComplianceCheck", "ContactDecision", "ComplianceReport",
+    "ConversationMetrics", "CollectionMetrics", "LLMMetrics"
+]
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List, Dict, Any, Union
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 
 
@@ -28,13 +28,41 @@ class PlanType(str, Enum):
     ONE_TIME = "one_time"
 
 
+# Metadata Models
+class RequestMetadata(BaseModel):
+    """Client-supplied context attached to API requests"""
+    model_config = ConfigDict(extra='allow')
+    
+    trace_id: Optional[str] = None
+    user_agent: Optional[str] = None
+    ip_address: Optional[str] = None
+    source: Optional[str] = None
+
+
+class UserMessageMetadata(RequestMetadata):
+    message_sid: Optional[str] = None  # Twilio message SID for SMS turns
+
+
+class PaymentMetadata(RequestMetadata):
+    external_reference: Optional[str] = None  # Stripe payment intent ID, etc.
+
+
+class AssistantMetadata(BaseModel):
+    escalation_reason: Optional[str] = None
+    fallback_reason: Optional[str] = None
+
+
+class ErrorDetails(BaseModel):
+    type: Optional[str] = None
+
+
 # Request Models
 class UserMessage(BaseModel):
     loan_id: int
     user_text: str
     session_id: str
     channel: ConversationChannel = ConversationChannel.CHAT
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[UserMessageMetadata] = None
 
 
 class IdentityVerificationRequest(BaseModel):
@@ -47,7 +75,7 @@ class PaymentRequest(BaseModel):
     amount: float
     payment_method: str
     conversation_id: str
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[PaymentMetadata] = None
 
 
 class EscalationRequest(BaseModel):
@@ -65,7 +93,8 @@ class StructuredPlan(BaseModel):
     first_due_date: Optional[str] = None
     frequency: Optional[str] = "monthly"
     
-    @validator('first_due_date')
+    @field_validator('first_due_date')
+    @classmethod
     def validate_date_format(cls, v):
         if v:
             try:
@@ -82,7 +111,7 @@ class AssistantResponse(BaseModel):
     confidence: float = Field(..., ge=0.0, le=1.0)
     escalation: bool = False
     compliance_checks: List[str] = []
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[AssistantMetadata] = None
 
 
 class ConversationResponse(BaseModel):
@@ -125,14 +154,6 @@ class ConversationInfo(BaseModel):
     assigned_agent_id: Optional[str] = None
 
 
-class MessageInfo(BaseModel):
-    id: int
-    message_type: str
-    content: str
-    confidence_score: Optional[float] = None
-    created_at: datetime
-
-
 class PaymentPlanInfo(BaseModel):
     id: int
     plan_type: str
@@ -152,62 +173,6 @@ class RAGQuery(BaseModel):
     top_k: int = 5
 
 
-class RAGResult(BaseModel):
-    document_id: str
-    content: str
-    score: float
-    metadata: Dict[str, Any]
-    document_type: str
-
-
-class RAGResponse(BaseModel):
-    results: List[RAGResult]
-    total_results: int
-    query_time: float
-
-
-# Compliance Models
-class ComplianceCheck(BaseModel):
-    check_name: str
-    passed: bool
-    details: Optional[str] = None
-    severity: str = "info"  # info, warning, error, critical
-
-
-class ComplianceReport(BaseModel):
-    conversation_id: str
-    checks: List[ComplianceCheck]
-    overall_status: str  # passed, warning, failed
-    requires_human_review: bool = False
-    timestamp: datetime
-
-
-# Analytics Models
-class ConversationMetrics(BaseModel):
-    total_conversations: int
-    active_conversations: int
-    escalated_conversations: int
-    resolution_rate: float
-    average_resolution_time: float
-    channel_breakdown: Dict[str, int]
-
-
-class CollectionMetrics(BaseModel):
-    total_amount_collected: float
-    number_of_payments: int
-    payment_plan_acceptance_rate: float
-    settlement_rate: float
-    average_days_to_resolution: float
-
-
-class LLMMetrics(BaseModel):
-    total_api_calls: int
-    total_tokens_used: int
-    average_response_time: float
-    total_cost: float
-    confidence_score_distribution: Dict[str, int]
-
-
 # Webhook Models
 class TwilioWebhook(BaseModel):
     MessageSid: str
@@ -218,11 +183,15 @@ class TwilioWebhook(BaseModel):
     NumMedia: Optional[str] = "0"
 
 
+class StripeEventData(BaseModel):
+    object: Dict[str, Any] = {}
+
+
 class StripeWebhook(BaseModel):
     id: str
     object: str
     type: str
-    data: Dict[str, Any]
+    data: StripeEventData
 
 
 # Configuration Models
@@ -237,6 +206,8 @@ class ComplianceConfig(BaseModel):
 
 
 class LLMConfig(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
     model_name: str = "llama-3.1-8b-instant"
     temperature: float = 0.45
     max_tokens: int = 1000
@@ -256,8 +227,8 @@ class SystemConfig(BaseModel):
 class ErrorResponse(BaseModel):
     error: str
     message: str
-    details: Optional[Dict[str, Any]] = None
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    details: Optional[ErrorDetails] = None
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
 class ValidationError(BaseModel):
@@ -276,13 +247,12 @@ class HealthCheck(BaseModel):
 
 # Export all models for easy importing
 __all__ = [
+    "RequestMetadata", "UserMessageMetadata", "PaymentMetadata", "AssistantMetadata", "ErrorDetails",
     "UserMessage", "IdentityVerificationRequest", "PaymentRequest", "EscalationRequest",
     "StructuredPlan", "AssistantResponse", "ConversationResponse",
-    "BorrowerInfo", "LoanInfo", "ConversationInfo", "MessageInfo", "PaymentPlanInfo",
-    "RAGQuery", "RAGResult", "RAGResponse",
-    "ComplianceCheck", "ComplianceReport",
-    "ConversationMetrics", "CollectionMetrics", "LLMMetrics",
-    "TwilioWebhook", "StripeWebhook",
+    "BorrowerInfo", "LoanInfo", "ConversationInfo", "PaymentPlanInfo",
+    "RAGQuery",
+    "TwilioWebhook", "StripeEventData", "StripeWebhook",
     "ComplianceConfig", "LLMConfig", "SystemConfig",
     "ErrorResponse", "ValidationError", "HealthCheck"
 ]
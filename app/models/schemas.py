@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Enum, Index
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -41,6 +42,13 @@ class ConversationState(enum.Enum):
     OPTED_OUT = "opted_out"
 
 
+class ChannelType(enum.Enum):
+    CHAT = "chat"
+    SMS = "sms"
+    EMAIL = "email"
+    VOICE = "voice"
+
+
 class MessageType(enum.Enum):
     USER = "user"
     ASSISTANT = "assistant"
@@ -70,6 +78,12 @@ class Borrower(Base):
     contact_hours_start = Column(String(5), default="09:00")  # HH:MM format
     contact_hours_end = Column(String(5), default="18:00")
     timezone = Column(String(50), default="UTC")
+    # Denormalized start time of the borrower's latest conversation; lets the
+    # contact-frequency check skip its COUNT query for dormant borrowers
+    last_contact_at = Column(DateTime)
+    # Start times of the borrower's most recent conversations, newest first,
+    # maintained by ComplianceService.record_contact
+    recent_contact_times = Column(ARRAY(DateTime))
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
@@ -127,14 +141,18 @@ class Transaction(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Contact-frequency checks filter by borrower and a created_at window
+        Index("ix_conv_borrower_created", "borrower_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(String(100), unique=True, index=True)
     borrower_id = Column(Integer, ForeignKey("borrowers.id"), nullable=False)
     loan_id = Column(Integer, ForeignKey("loans.id"), nullable=False)
     state = Column(Enum(ConversationState), default=ConversationState.INITIATED)
-    channel = Column(String(20), nullable=False)  # chat, sms, email, voice
-    session_data = Column(JSON)  # Store session context and variables
+    channel = Column(Enum(ChannelType), nullable=False)
+    session_data = Column(JSONB)  # Store session context and variables
     identity_verified = Column(Boolean, default=False)
     verification_attempts = Column(Integer, default=0)
     last_activity = Column(DateTime, server_default=func.now())
@@ -143,29 +161,43 @@ class Conversation(Base):
     escalation_date = Column(DateTime)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Row version; ORM updates are issued as UPDATE ... WHERE version = :seen
+    # and fail with StaleDataError when another transaction changed the row
+    version = Column(Integer, nullable=False, server_default="0")
     
-    # Relationships
-    borrower = relationship("Borrower", back_populates="conversations")
-    loan = relationship("Loan", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation")
+    # Fetch server defaults (last_activity, created_at) on INSERT so they can
+    # be read without an implicit lazy load under AsyncSession
+    __mapper_args__ = {"eager_defaults": True, "version_id_col": version}
+    
+    # Relationships. Implicit lazy loads cannot run under AsyncSession, so
+    # these raise instead; callers that need them must use selectinload().
+    borrower = relationship("Borrower", back_populates="conversations", lazy="raise")
+    loan = relationship("Loan", back_populates="conversations", lazy="raise")
+    messages = relationship("Message", back_populates="conversation", lazy="raise")
 
 
 class Message(Base):
     __tablename__ = "messages"
+    # Return created_at on INSERT so new messages can be cached without a reload
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        Index("ix_msg_conversation_created", "conversation_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     message_type = Column(Enum(MessageType), nullable=False)
     content = Column(Text, nullable=False)
-    metadata = Column(JSON)  # Store LLM response data, confidence scores, etc.
+    # "metadata" is reserved on declarative classes; the column keeps its name
+    message_metadata = Column("metadata", JSONB)  # Store LLM response data, confidence scores, etc.
     tokens_used = Column(Integer)
     processing_time = Column(Float)  # Response time in seconds
     confidence_score = Column(Float)
-    compliance_flags = Column(JSON)  # Store compliance check results
+    compliance_flags = Column(JSONB)  # Store compliance check results
     created_at = Column(DateTime, server_default=func.now())
     
     # Relationships
-    conversation = relationship("Conversation", back_populates="messages")
+    conversation = relationship("Conversation", back_populates="messages", lazy="raise")
 
 
 class PaymentPlan(Base):
@@ -211,15 +243,18 @@ class ScheduledPayment(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_conversation_timestamp", "conversation_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(String(100), index=True)
+    conversation_id = Column(String(100))
     loan_id = Column(Integer, index=True)
     borrower_id = Column(Integer, index=True)
     action = Column(String(100), nullable=False)
     actor = Column(String(100), nullable=False)  # system, agent_id, user
-    details = Column(JSON)
-    compliance_data = Column(JSON)
+    details = Column(JSONB)
+    compliance_data = Column(JSONB)
     ip_address = Column(String(45))
     user_agent = Column(Text)
     timestamp = Column(DateTime, server_default=func.now())
@@ -227,10 +262,13 @@ class AuditLog(Base):
 
 class ComplianceEvent(Base):
     __tablename__ = "compliance_events"
+    __table_args__ = (
+        Index("ix_compliance_conversation_created", "conversation_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     event_type = Column(String(100), nullable=False)
-    conversation_id = Column(String(100), index=True)
+    conversation_id = Column(String(100))
     loan_id = Column(Integer, index=True)
     borrower_id = Column(Integer, index=True)
     severity = Column(String(20), default="info")  # info, warning, error, critical
@@ -239,7 +277,7 @@ class ComplianceEvent(Base):
     requires_review = Column(Boolean, default=False)
     reviewed_by = Column(String(100))
     reviewed_at = Column(DateTime)
-    metadata = Column(JSON)
+    event_metadata = Column("metadata", JSONB)
     created_at = Column(DateTime, server_default=func.now())
 
 
@@ -253,7 +291,7 @@ class VectorDocument(Base):
     title = Column(String(255))
     content = Column(Text, nullable=False)
     chunk_index = Column(Integer, default=0)
-    metadata = Column(JSON)
+    document_metadata = Column("metadata", JSONB)
     loan_id = Column(Integer, ForeignKey("loans.id"))
     borrower_id = Column(Integer, ForeignKey("borrowers.id"))
     embedding_model = Column(String(100))
@@ -1,15 +1,52 @@
 import os
-from typing import Dict, Any, List, Optional
+import re
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Tuple
 from datetime import datetime, time, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from time import time as epoch_seconds
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import DateTime, and_, case, desc, func, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from ..models.schemas import Borrower, Conversation, ComplianceEvent, ConversationState
-from ..models.pydantic_models import ComplianceCheck, ComplianceReport
+from ..models.internal_models import ComplianceCheck, ComplianceReport, ContactDecision
 from ..utils.logging_config import get_logger, log_compliance_event
 
 logger = get_logger(__name__)
 
+# Shared results for the fixed-text passing checks. ComplianceCheck is frozen,
+# so one instance can be handed to every caller.
+_OPT_OUT_OK = ComplianceCheck(
+    check_name="opt_out_status",
+    passed=True,
+    details="Borrower has not opted out"
+)
+_CONTACT_TIME_OK = ComplianceCheck(
+    check_name="contact_time",
+    passed=True,
+    details="Contact time is within allowed hours"
+)
+_PROHIBITED_LANG_OK = ComplianceCheck(
+    check_name="prohibited_language",
+    passed=True,
+    details="No prohibited language detected"
+)
+
+# (epoch second, local datetime) for the contact-window check. Replaced as a
+# whole tuple, so concurrent readers never see a torn value.
+_clock_cache = (0, datetime.fromtimestamp(0))
+
+
+def _cached_now() -> datetime:
+    """Local wall-clock time at one-second resolution"""
+    global _clock_cache
+    second = int(epoch_seconds())
+    cached_second, cached_now = _clock_cache
+    if second != cached_second:
+        cached_now = datetime.fromtimestamp(second)
+        _clock_cache = (second, cached_now)
+    return cached_now
+
 
 class ComplianceService:
     """
@@ -23,6 +60,16 @@ class ComplianceService:
     - Regulatory compliance monitoring
     """
     
+    # Message screening pattern, compiled once and applied in a single pass;
+    # the named group says which rule matched. Only the leading word boundary
+    # is anchored so inflections ("threatened", "lawsuits") are still caught.
+    _MESSAGE_SCREEN_RE = re.compile(
+        r"(?P<prohibited>\b(?:threaten|sue|arrest|jail|garnish|seize|ruin credit|legal action|court|lawsuit))"
+        r"|(?P<account>\b(?:balance|amount|payment)|\$)"
+        r"|(?P<collector>debt collector|collection)",
+        re.IGNORECASE
+    )
+    
     def __init__(self):
         # Load compliance configuration from environment
         self.max_settlement_percentage = float(os.getenv("MAX_SETTLEMENT_PERCENTAGE", "0.70"))
@@ -31,19 +78,62 @@ class ComplianceService:
         self.contact_hours_end = os.getenv("CONTACT_HOURS_END", "21:00")
         self.max_daily_contact_attempts = 3
         self.max_weekly_contact_attempts = 7
+        # Enough recent contact times to decide both limits exactly
+        self._recent_contacts_kept = max(self.max_daily_contact_attempts, self.max_weekly_contact_attempts)
+        # "counters" counts the borrower's recent contact times; "query" counts
+        # conversations in the database (kept for auditing the counters)
+        self.contact_frequency_source = os.getenv("CONTACT_FREQUENCY_SOURCE", "counters")
+        
+        # Passing frequency checks, one per count below the limit
+        self._daily_frequency_ok = tuple(
+            ComplianceCheck(
+                check_name="daily_contact_frequency",
+                passed=True,
+                details=f"Daily contact attempts: {n}/{self.max_daily_contact_attempts}"
+            )
+            for n in range(self.max_daily_contact_attempts)
+        )
+        self._weekly_frequency_ok = tuple(
+            ComplianceCheck(
+                check_name="weekly_contact_frequency",
+                passed=True,
+                details=f"Weekly contact attempts: {n}/{self.max_weekly_contact_attempts}"
+            )
+            for n in range(self.max_weekly_contact_attempts)
+        )
+        
+        # Parse contact hours once; None disables the check if misconfigured
+        try:
+            self._start_time = time.fromisoformat(self.contact_hours_start)
+            self._end_time = time.fromisoformat(self.contact_hours_end)
+        except ValueError as e:
+            logger.error(f"Error parsing contact hours: {e}")
+            # Default to allowing contact if configuration is invalid
+            self._start_time = self._end_time = None
         
         # Prohibited contact days (0=Monday, 6=Sunday)
-        self.prohibited_days = [6]  # Sunday
+        self.prohibited_days = frozenset({6})  # Sunday
+        
+        # Read-only view of the configuration, built once
+        self._config = MappingProxyType({
+            "max_settlement_percentage": self.max_settlement_percentage,
+            "max_installment_months": self.max_installment_months,
+            "contact_hours_start": self.contact_hours_start,
+            "contact_hours_end": self.contact_hours_end,
+            "max_daily_contact_attempts": self.max_daily_contact_attempts,
+            "max_weekly_contact_attempts": self.max_weekly_contact_attempts,
+            "prohibited_days": tuple(sorted(self.prohibited_days))
+        })
         
         logger.info("Compliance Service initialized with FDCPA guidelines")
     
     async def check_contact_compliance(self, borrower: Borrower, conversation: Conversation,
-                                     db: Session) -> Dict[str, Any]:
+                                     db: AsyncSession) -> ContactDecision:
         """
         Comprehensive compliance check before allowing contact
         
         Returns:
-            Dict with 'allowed' boolean and 'reason' if blocked
+            ContactDecision with 'allowed' and the 'reason' if blocked
         """
         
         checks = []
@@ -52,30 +142,43 @@ class ComplianceService:
         opt_out_check = self._check_opt_out_status(borrower)
         checks.append(opt_out_check)
         if not opt_out_check.passed:
-            return {"allowed": False, "reason": "Borrower has opted out of communications"}
+            self._log_compliance_check(borrower.id, checks)
+            return ContactDecision(allowed=False, reason="Borrower has opted out of communications",
+                                   checks=tuple(checks))
         
         # Check contact time restrictions
         time_check = self._check_contact_time(borrower)
         checks.append(time_check)
         if not time_check.passed:
-            return {"allowed": False, "reason": time_check.details}
+            self._log_compliance_check(borrower.id, checks)
+            return ContactDecision(allowed=False, reason=time_check.details, checks=tuple(checks))
+        
+        # Daily and weekly contact counts come from the borrower's recent contact times, or
+        # from a single aggregate query skipped when the borrower has had no
+        # conversation in the last week
+        last_contact_at = borrower.last_contact_at
+        if self.contact_frequency_source == "counters":
+            daily_count, weekly_count = self._get_contact_frequency_counters(borrower)
+        elif last_contact_at is not None and last_contact_at < datetime.now() - timedelta(days=7):
+            daily_count, weekly_count = 0, 0
+        else:
+            daily_count, weekly_count = await self._get_contact_frequency_counts(borrower.id, db)
         
         # Check daily contact frequency
-        daily_check = await self._check_daily_contact_frequency(borrower, db)
+        daily_check = self._check_daily_contact_frequency(daily_count)
         checks.append(daily_check)
         if not daily_check.passed:
-            return {"allowed": False, "reason": daily_check.details}
+            self._log_compliance_check(borrower.id, checks)
+            return ContactDecision(allowed=False, reason=daily_check.details, checks=tuple(checks))
         
         # Check weekly contact frequency
-        weekly_check = await self._check_weekly_contact_frequency(borrower, db)
+        weekly_check = self._check_weekly_contact_frequency(weekly_count)
         checks.append(weekly_check)
         if not weekly_check.passed:
-            return {"allowed": False, "reason": weekly_check.details}
-        
-        # Log compliance check
-        await self._log_compliance_check(borrower.id, checks)
+            self._log_compliance_check(borrower.id, checks)
+            return ContactDecision(allowed=False, reason=weekly_check.details, checks=tuple(checks))
         
-        return {"allowed": True, "reason": None, "checks": checks}
+        return ContactDecision(allowed=True, checks=tuple(checks))
     
     def _check_opt_out_status(self, borrower: Borrower) -> ComplianceCheck:
         """Check if borrower has opted out of communications"""
@@ -88,16 +191,12 @@ class ComplianceService:
                 severity="critical"
             )
         
-        return ComplianceCheck(
-            check_name="opt_out_status",
-            passed=True,
-            details="Borrower has not opted out"
-        )
+        return _OPT_OUT_OK
     
     def _check_contact_time(self, borrower: Borrower) -> ComplianceCheck:
         """Check if current time is within allowed contact hours"""
         
-        now = datetime.now()
+        now = _cached_now()
         
         # Check if today is a prohibited day
         if now.weekday() in self.prohibited_days:
@@ -108,46 +207,76 @@ class ComplianceService:
                 severity="warning"
             )
         
-        # Parse contact hours
-        try:
-            start_time = time.fromisoformat(self.contact_hours_start)
-            end_time = time.fromisoformat(self.contact_hours_end)
-            current_time = now.time()
-            
-            # Check if current time is within allowed hours
-            if not (start_time <= current_time <= end_time):
-                return ComplianceCheck(
-                    check_name="contact_time",
-                    passed=False,
-                    details=f"Contact only allowed between {self.contact_hours_start} and {self.contact_hours_end}",
-                    severity="warning"
-                )
+        # Check if current time is within allowed hours
+        if self._start_time is not None and not (self._start_time <= now.time() <= self._end_time):
+            return ComplianceCheck(
+                check_name="contact_time",
+                passed=False,
+                details=f"Contact only allowed between {self.contact_hours_start} and {self.contact_hours_end}",
+                severity="warning"
+            )
         
-        except ValueError as e:
-            logger.error(f"Error parsing contact hours: {e}")
-            # Default to allowing contact if configuration is invalid
+        return _CONTACT_TIME_OK
+    
+    async def record_contact(self, borrower_id: int, db: AsyncSession):
+        """Record a new conversation in the borrower's recent contact times"""
         
-        return ComplianceCheck(
-            check_name="contact_time",
-            passed=True,
-            details="Contact time is within allowed hours"
+        now = datetime.now()
+        # Single atomic UPDATE: prepend this contact and keep the newest ones.
+        # Both limits are at most the number kept, so counting the kept times
+        # over the rolling windows gives the same verdict as the COUNT query.
+        await db.execute(
+            update(Borrower).where(Borrower.id == borrower_id).values(
+                last_contact_at=now,
+                recent_contact_times=func.array_prepend(
+                    now, Borrower.recent_contact_times, type_=ARRAY(DateTime)
+                )[1:self._recent_contacts_kept]
+            ),
+            execution_options={"synchronize_session": "fetch"}
         )
     
-    async def _check_daily_contact_frequency(self, borrower: Borrower, db: Session) -> ComplianceCheck:
-        """Check daily contact attempt limits"""
+    def _get_contact_frequency_counters(self, borrower: Borrower) -> Tuple[int, int]:
+        """Count contacts today and in the last 7 days from the borrower row"""
         
-        today = datetime.now().date()
-        today_start = datetime.combine(today, time.min)
-        today_end = datetime.combine(today, time.max)
+        now = datetime.now()
+        today_start = datetime.combine(now.date(), time.min)
+        week_start = now - timedelta(days=7)
+        daily = weekly = 0
+        for contact_time in borrower.recent_contact_times or ():
+            if contact_time >= week_start:
+                weekly += 1
+                if contact_time >= today_start:
+                    daily += 1
+        return daily, weekly
+    
+    async def _get_contact_frequency_counts(self, borrower_id: int, db: AsyncSession) -> Tuple[int, int]:
+        """Count conversations started today and in the last 7 days in one round-trip"""
         
-        # Count conversations started today
-        daily_conversations = db.query(Conversation).filter(
-            and_(
-                Conversation.borrower_id == borrower.id,
-                Conversation.created_at >= today_start,
-                Conversation.created_at <= today_end
+        now = datetime.now()
+        today_start = datetime.combine(now.date(), time.min)
+        today_end = datetime.combine(now.date(), time.max)
+        week_start = now - timedelta(days=7)
+        
+        result = await db.execute(
+            select(
+                func.coalesce(func.sum(case(
+                    (and_(Conversation.created_at >= today_start,
+                          Conversation.created_at <= today_end), 1),
+                    else_=0
+                )), 0),
+                func.count(Conversation.id)
+            ).where(
+                and_(
+                    Conversation.borrower_id == borrower_id,
+                    Conversation.created_at >= week_start
+                )
             )
-        ).count()
+        )
+        daily_conversations, weekly_conversations = result.one()
+        return int(daily_conversations), weekly_conversations
+    
+    def _check_daily_contact_frequency(self, daily_conversations: int) -> ComplianceCheck:
+        """Check daily contact attempt limits"""
         
         if daily_conversations >= self.max_daily_contact_attempts:
             return ComplianceCheck(
@@ -157,25 +286,11 @@ class ComplianceService:
                 severity="warning"
             )
         
-        return ComplianceCheck(
-            check_name="daily_contact_frequency",
-            passed=True,
-            details=f"Daily contact attempts: {daily_conversations}/{self.max_daily_contact_attempts}"
-        )
+        return self._daily_frequency_ok[daily_conversations]
     
-    async def _check_weekly_contact_frequency(self, borrower: Borrower, db: Session) -> ComplianceCheck:
+    def _check_weekly_contact_frequency(self, weekly_conversations: int) -> ComplianceCheck:
         """Check weekly contact attempt limits"""
         
-        week_start = datetime.now() - timedelta(days=7)
-        
-        # Count conversations in the last 7 days
-        weekly_conversations = db.query(Conversation).filter(
-            and_(
-                Conversation.borrower_id == borrower.id,
-                Conversation.created_at >= week_start
-            )
-        ).count()
-        
         if weekly_conversations >= self.max_weekly_contact_attempts:
             return ComplianceCheck(
                 check_name="weekly_contact_frequency",
@@ -184,11 +299,7 @@ class ComplianceService:
                 severity="warning"
             )
         
-        return ComplianceCheck(
-            check_name="weekly_contact_frequency",
-            passed=True,
-            details=f"Weekly contact attempts: {weekly_conversations}/{self.max_weekly_contact_attempts}"
-        )
+        return self._weekly_frequency_ok[weekly_conversations]
     
     async def validate_payment_plan(self, plan_data: Dict[str, Any], loan_balance: float) -> List[ComplianceCheck]:
         """Validate payment plan against compliance rules"""
@@ -255,18 +366,18 @@ class ComplianceService:
         
         checks = []
         
-        # Check for prohibited language
-        prohibited_phrases = [
-            "threaten", "sue", "arrest", "jail", "garnish", "seize",
-            "ruin credit", "legal action", "court", "lawsuit"
-        ]
-        
-        message_lower = message.lower()
-        found_violations = []
-        
-        for phrase in prohibited_phrases:
-            if phrase in message_lower:
-                found_violations.append(phrase)
+        # Scan the message once for all screening rules
+        found_violations = {}  # insertion-ordered set of prohibited phrases
+        mentions_account_info = False
+        identifies_collector = False
+        for match in self._MESSAGE_SCREEN_RE.finditer(message):
+            rule = match.lastgroup
+            if rule == "prohibited":
+                found_violations[match.group(0).lower()] = None
+            elif rule == "account":
+                mentions_account_info = True
+            else:
+                identifies_collector = True
         
         if found_violations:
             checks.append(ComplianceCheck(
@@ -276,15 +387,11 @@ class ComplianceService:
                 severity="critical"
             ))
         else:
-            checks.append(ComplianceCheck(
-                check_name="prohibited_language",
-                passed=True,
-                details="No prohibited language detected"
-            ))
+            checks.append(_PROHIBITED_LANG_OK)
         
         # Check for required disclosures
         if not conversation_context.get("identity_verified", False):
-            if any(keyword in message_lower for keyword in ["balance", "amount", "payment", "$"]):
+            if mentions_account_info:
                 checks.append(ComplianceCheck(
                     check_name="identity_verification",
                     passed=False,
@@ -293,7 +400,7 @@ class ComplianceService:
                 ))
         
         # Check for debt collector identification
-        if "debt collector" not in message_lower and "collection" not in message_lower:
+        if not identifies_collector:
             checks.append(ComplianceCheck(
                 check_name="debt_collector_identification",
                 passed=False,
@@ -303,26 +410,26 @@ class ComplianceService:
         
         return checks
     
-    async def handle_opt_out_request(self, borrower_id: int, conversation_id: str, db: Session) -> Dict[str, Any]:
+    async def handle_opt_out_request(self, borrower_id: int, conversation_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Handle borrower opt-out request"""
         
-        borrower = db.query(Borrower).filter(Borrower.id == borrower_id).first()
+        borrower = await db.get(Borrower, borrower_id)
         if not borrower:
             raise ValueError(f"Borrower {borrower_id} not found")
         
         # Update borrower opt-out status
         borrower.opt_out_date = datetime.utcnow()
         
-        # Close all active conversations
-        active_conversations = db.query(Conversation).filter(
-            and_(
-                Conversation.borrower_id == borrower_id,
-                Conversation.state.notin_([ConversationState.CLOSED, ConversationState.OPTED_OUT])
-            )
-        ).all()
-        
-        for conv in active_conversations:
-            conv.state = ConversationState.OPTED_OUT
+        # Close all active conversations in a single UPDATE
+        await db.execute(
+            update(Conversation).where(
+                and_(
+                    Conversation.borrower_id == borrower_id,
+                    Conversation.state.notin_([ConversationState.CLOSED, ConversationState.OPTED_OUT])
+                )
+            ).values(state=ConversationState.OPTED_OUT, version=Conversation.version + 1),
+            execution_options={"synchronize_session": False}
+        )
         
         # Log compliance event
         log_compliance_event(
@@ -334,7 +441,7 @@ class ComplianceService:
             user_id=str(borrower_id)
         )
         
-        db.commit()
+        await db.commit()
         
         logger.info(f"Borrower {borrower_id} opted out of communications")
         
@@ -345,7 +452,7 @@ class ComplianceService:
         }
     
     async def handle_debt_validation_request(self, borrower_id: int, loan_id: int, 
-                                           conversation_id: str, db: Session) -> Dict[str, Any]:
+                                           conversation_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Handle debt validation request"""
         
         # Log compliance event
@@ -359,21 +466,24 @@ class ComplianceService:
             loan_id=str(loan_id)
         )
         
-        # Pause collection activities
-        active_conversations = db.query(Conversation).filter(
-            and_(
-                Conversation.borrower_id == borrower_id,
-                Conversation.loan_id == loan_id,
-                Conversation.state == ConversationState.ACTIVE_NEGOTIATION
-            )
-        ).all()
-        
-        for conv in active_conversations:
-            conv.state = ConversationState.ESCALATED
-            conv.escalation_reason = "Debt validation requested"
-            conv.escalation_date = datetime.utcnow()
+        # Pause collection activities in a single UPDATE
+        await db.execute(
+            update(Conversation).where(
+                and_(
+                    Conversation.borrower_id == borrower_id,
+                    Conversation.loan_id == loan_id,
+                    Conversation.state == ConversationState.ACTIVE_NEGOTIATION
+                )
+            ).values(
+                state=ConversationState.ESCALATED,
+                escalation_reason="Debt validation requested",
+                escalation_date=datetime.utcnow(),
+                version=Conversation.version + 1
+            ),
+            execution_options={"synchronize_session": False}
+        )
         
-        db.commit()
+        await db.commit()
         
         logger.info(f"Debt validation requested for loan {loan_id}, borrower {borrower_id}")
         
@@ -383,26 +493,33 @@ class ComplianceService:
             "next_steps": "You will receive validation documentation within 30 days as required by law."
         }
     
-    async def generate_compliance_report(self, conversation_id: str, db: Session) -> ComplianceReport:
+    async def generate_compliance_report(self, conversation_id: str, db: AsyncSession) -> ComplianceReport:
         """Generate comprehensive compliance report for a conversation"""
         
-        conversation = db.query(Conversation).filter(
-            Conversation.conversation_id == conversation_id
-        ).first()
+        result = await db.execute(
+            select(Conversation).where(Conversation.conversation_id == conversation_id)
+        )
+        conversation = result.scalars().first()
         
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
         
-        # Get all compliance events for this conversation
-        compliance_events = db.query(ComplianceEvent).filter(
-            ComplianceEvent.conversation_id == conversation_id
-        ).order_by(ComplianceEvent.created_at).all()
+        # Stream this conversation's compliance events through a server-side cursor
+        compliance_events = await db.stream(
+            select(
+                ComplianceEvent.event_type,
+                ComplianceEvent.severity,
+                ComplianceEvent.description
+            ).where(
+                ComplianceEvent.conversation_id == conversation_id
+            ).order_by(ComplianceEvent.created_at).execution_options(yield_per=500)
+        )
         
         checks = []
         overall_status = "passed"
         requires_review = False
         
-        for event in compliance_events:
+        async for event in compliance_events:
             severity = event.severity or "info"
             passed = severity not in ["error", "critical"]
             
@@ -425,33 +542,51 @@ class ComplianceService:
             timestamp=datetime.utcnow()
         )
     
-    async def _log_compliance_check(self, borrower_id: int, checks: List[ComplianceCheck]):
-        """Log compliance check results"""
+    def _log_compliance_check(self, borrower_id: int, checks: List[ComplianceCheck]):
+        """Send failed compliance checks to the audit log"""
         
         for check in checks:
-            if not check.passed:
-                log_compliance_event(
-                    event_type=f"compliance_violation_{check.check_name}",
-                    details={
-                        "check_name": check.check_name,
-                        "details": check.details,
-                        "severity": check.severity
-                    },
-                    user_id=str(borrower_id)
-                )
+            if check.passed:
+                continue
+            log_compliance_event(
+                event_type=f"compliance_violation_{check.check_name}",
+                details={
+                    "check_name": check.check_name,
+                    "details": check.details,
+                    "severity": check.severity
+                },
+                user_id=str(borrower_id)
+            )
     
-    def get_compliance_config(self) -> Dict[str, Any]:
-        """Get current compliance configuration"""
+    async def record_compliance_events(self, conversation_id: str, loan_id: int, borrower_id: int,
+                                       checks: Tuple[ComplianceCheck, ...], db: AsyncSession):
+        """Record failed compliance checks as compliance events; the caller owns the commit"""
+        
+        failed_checks = [check for check in checks if not check.passed]
+        if not failed_checks:
+            return
+        
+        # One executemany INSERT for all violations
+        await db.execute(
+            insert(ComplianceEvent),
+            [
+                {
+                    "event_type": f"compliance_violation_{check.check_name}",
+                    "conversation_id": conversation_id,
+                    "loan_id": loan_id,
+                    "borrower_id": borrower_id,
+                    "severity": check.severity,
+                    "description": check.details,
+                    "requires_review": check.severity in ("error", "critical")
+                }
+                for check in failed_checks
+            ]
+        )
+    
+    def get_compliance_config(self) -> Mapping[str, Any]:
+        """Get current compliance configuration (read-only)"""
         
-        return {
-            "max_settlement_percentage": self.max_settlement_percentage,
-            "max_installment_months": self.max_installment_months,
-            "contact_hours_start": self.contact_hours_start,
-            "contact_hours_end": self.contact_hours_end,
-            "max_daily_contact_attempts": self.max_daily_contact_attempts,
-            "max_weekly_contact_attempts": self.max_weekly_contact_attempts,
-            "prohibited_days": self.prohibited_days
-        }
+        return self._config
 
 
 # Global compliance service instance
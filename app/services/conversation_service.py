@@ -1,27 +1,68 @@
+import time
 import uuid
-from typing import Dict, Any, Optional, List
+import calendar
+import hmac
+from functools import lru_cache
+from types import MappingProxyType
+import msgspec
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Any, Mapping, Optional, List
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import and_, desc, insert, select, update
 
 from ..models.schemas import (
     Conversation, Message, Borrower, Loan, PaymentPlan, ScheduledPayment,
     Transaction, AuditLog, ComplianceEvent, ConversationState, MessageType,
-    PaymentPlanType, TransactionType
+    ChannelType, PaymentPlanType, TransactionType
 )
 from ..models.pydantic_models import (
     ConversationResponse, AssistantResponse, ConversationChannel,
-    ActionType, BorrowerInfo, LoanInfo, ConversationInfo, MessageInfo
+    ActionType, PlanType, BorrowerInfo, LoanInfo, ConversationInfo,
+    UserMessageMetadata, PaymentMetadata
 )
-from ..services.llm_service import llm_service
+from ..models.internal_models import MessageInfo, MessageTurn
+from ..services.llm_service import get_llm_service
+from ..services.rag_service import get_rag_service
 from ..services.compliance_service import compliance_service
 from ..utils.logging_config import (
     get_logger, log_compliance_event, log_conversation_event,
     log_payment_event, log_escalation_event
 )
+from ..utils.background_events import enqueue_event
 
 logger = get_logger(__name__)
 
+# LLM plan type -> stored payment plan type
+_PLAN_TYPE_MAP: Mapping[PlanType, PaymentPlanType] = MappingProxyType({
+    PlanType.INSTALLMENT: PaymentPlanType.INSTALLMENT,
+    PlanType.SETTLEMENT: PaymentPlanType.SETTLEMENT,
+    PlanType.ONE_TIME: PaymentPlanType.FULL_PAYMENT
+})
+
+# Canned assistant replies are built once and shared; only the conversation
+# id differs between responses, so they skip model validation per call
+_OPTED_OUT_ASSISTANT = AssistantResponse(
+    action=ActionType.CLOSE,
+    message_to_user="This contact has opted out of communications. No further messages will be sent.",
+    confidence=1.0,
+    escalation=False,
+    compliance_checks=["opt_out_respected"]
+)
+
+
+@lru_cache(maxsize=64)
+def _compliance_blocked_assistant(reason: str) -> AssistantResponse:
+    """Blocked-contact reply per reason; the set of reasons is small and fixed"""
+    return AssistantResponse(
+        action=ActionType.CLOSE,
+        message_to_user=f"Contact not allowed at this time: {reason}",
+        confidence=1.0,
+        escalation=False,
+        compliance_checks=["contact_time_restriction"]
+    )
+
 
 class ConversationService:
     """
@@ -39,10 +80,28 @@ class ConversationService:
     def __init__(self):
         self.max_verification_attempts = 3
         self.session_timeout_minutes = 30
+        # Attempts to apply a turn when the conversation row changed under it
+        self.max_turn_commit_attempts = 2
+        
+        # Short-lived cache for dashboard polling of /loan/{id}/conversations:
+        # loan_id -> (expires_at, conversations)
+        self.loan_conversations_ttl = 5.0
+        self.loan_conversations_cache_size = 1024
+        self._loan_conversations_cache: Dict[int, tuple] = {}
+        
+        # Recent-message window used as LLM context, kept warm between turns:
+        # conversation pk -> (expires_at, conversation version, deque of
+        # formatted messages). Every turn bumps the conversation's version, on
+        # whichever worker it runs, so a window is only reused while the
+        # version it was read at is still current.
+        self.message_history_ttl = 60.0
+        self.message_history_cache_size = 10000
+        self.message_history_length = 10
+        self._message_history_cache: Dict[int, tuple] = {}
         
     async def process_message(self, user_message: str, loan_id: int, session_id: str,
-                            channel: ConversationChannel, metadata: Dict[str, Any] = None,
-                            db: Session = None) -> ConversationResponse:
+                            channel: ConversationChannel, metadata: Optional[UserMessageMetadata] = None,
+                            db: AsyncSession = None) -> ConversationResponse:
         """
         Process a user message and generate appropriate response
         
@@ -67,91 +126,145 @@ class ConversationService:
             if conversation.state == ConversationState.OPTED_OUT:
                 return self._create_opted_out_response(conversation.conversation_id)
             
-            # Get borrower and loan information
-            loan = db.query(Loan).filter(Loan.id == loan_id).first()
-            if not loan:
-                raise ValueError(f"Loan {loan_id} not found")
-            
-            borrower = db.query(Borrower).filter(Borrower.id == loan.borrower_id).first()
-            if not borrower:
-                raise ValueError(f"Borrower for loan {loan_id} not found")
+            # Get borrower and loan information in one round-trip
+            result = await db.execute(
+                select(Loan, Borrower).join(
+                    Borrower, Loan.borrower_id == Borrower.id
+                ).where(Loan.id == loan_id)
+            )
+            row = result.first()
+            if not row:
+                raise ValueError(f"Loan {loan_id} or its borrower not found")
+            loan, borrower = row
             
             # Check compliance before processing
             compliance_check = await compliance_service.check_contact_compliance(
                 borrower, conversation, db
             )
             
-            if not compliance_check["allowed"]:
+            if not compliance_check.allowed:
+                # Persist only the compliance events: the conversation opened
+                # for this attempt and the contact recorded for it are rolled
+                # back, so blocked attempts do not count toward the limits
+                conversation_id, borrower_id = conversation.conversation_id, borrower.id
+                await db.rollback()
+                await compliance_service.record_compliance_events(
+                    conversation_id, loan_id, borrower_id, compliance_check.checks, db
+                )
+                await db.commit()
                 return self._create_compliance_blocked_response(
-                    conversation.conversation_id, compliance_check["reason"]
+                    conversation_id, compliance_check.reason
                 )
             
-            # Save user message
-            user_msg = Message(
-                conversation_id=conversation.id,
-                message_type=MessageType.USER,
-                content=user_message,
-                metadata=metadata or {}
-            )
-            db.add(user_msg)
-            
             # Build conversation context
             conversation_context = await self._build_conversation_context(conversation, db)
             
-            # Process with LLM
-            assistant_response = llm_service.process_conversation(
+            # Process with LLM; blocking RAG work runs in worker threads and
+            # the ChatGroq call is awaited
+            assistant_response = await get_llm_service().aprocess_conversation(
                 user_message=user_message,
                 conversation_context=conversation_context,
                 loan_id=loan_id,
-                borrower_id=borrower.id
+                borrower_id=borrower.id,
+                account_version=loan.updated_at
             )
             
-            # Handle specific actions
-            response = await self._handle_assistant_action(
-                assistant_response, conversation, loan, borrower, db
-            )
+            # The conversation row is version-checked, so the commit fails if a
+            # concurrent turn or an opt-out committed first. The row is then
+            # re-read and only this turn's changes are re-applied; the LLM
+            # reply is kept, not regenerated.
+            borrower_id, conversation_pk = borrower.id, conversation.id
+            history_version = conversation.version
+            for attempt in range(self.max_turn_commit_attempts):
+                try:
+                    response, user_msg, assistant_msg = await self._apply_turn(
+                        conversation, loan, borrower, user_message, metadata,
+                        assistant_response, db
+                    )
+                    await db.commit()
+                    break
+                except StaleDataError:
+                    await db.rollback()
+                    if attempt + 1 == self.max_turn_commit_attempts:
+                        raise
+                    logger.info(
+                        f"Conversation {conversation_pk} changed concurrently, re-applying turn"
+                    )
+                    await db.refresh(conversation)
+                    await db.refresh(loan)
+                    if conversation.state == ConversationState.OPTED_OUT:
+                        return self._create_opted_out_response(conversation.conversation_id)
             
-            # Save assistant message
-            assistant_msg = Message(
-                conversation_id=conversation.id,
-                message_type=MessageType.ASSISTANT,
-                content=assistant_response.message_to_user,
-                metadata=assistant_response.dict(),
-                confidence_score=assistant_response.confidence,
-                compliance_flags=assistant_response.compliance_checks
+            # Log compliance events off the request path
+            enqueue_event(
+                self._log_compliance_events, conversation.conversation_id,
+                tuple(assistant_response.compliance_checks), assistant_response.action.value,
+                assistant_response.confidence, borrower_id, loan_id
             )
-            db.add(assistant_msg)
-            
-            # Update conversation state
-            await self._update_conversation_state(conversation, assistant_response, db)
             
-            # Log compliance events
-            await self._log_compliance_events(
-                conversation, assistant_response, borrower.id, loan_id
+            self.invalidate_loan_conversations(loan_id)
+            self._append_message_history(
+                conversation_pk, history_version, conversation.version, user_msg, assistant_msg
             )
             
-            db.commit()
-            
             return response
             
         except Exception as e:
             logger.error(f"Error processing message: {e}")
-            db.rollback()
+            await db.rollback()
             raise
     
+    async def _apply_turn(self, conversation: Conversation, loan: Loan, borrower: Borrower,
+                          user_message: str, metadata: Optional[UserMessageMetadata],
+                          assistant_response: AssistantResponse, db: AsyncSession):
+        """Stage a turn's messages, actions and state change in the session"""
+        
+        # Handle specific actions
+        response = await self._handle_assistant_action(
+            assistant_response, conversation, loan, borrower, db
+        )
+        
+        # Both messages set the same columns, so the flush sends them as one
+        # multi-row INSERT ... RETURNING instead of two round-trips
+        user_msg = Message(
+            conversation_id=conversation.id,
+            message_type=MessageType.USER,
+            content=user_message,
+            message_metadata=metadata.model_dump(exclude_none=True) if metadata else {},
+            confidence_score=None,
+            compliance_flags=None
+        )
+        assistant_msg = Message(
+            conversation_id=conversation.id,
+            message_type=MessageType.ASSISTANT,
+            content=assistant_response.message_to_user,
+            message_metadata=assistant_response.model_dump(),
+            confidence_score=assistant_response.confidence,
+            compliance_flags=assistant_response.compliance_checks
+        )
+        db.add_all([user_msg, assistant_msg])
+        
+        # Update conversation state
+        await self._update_conversation_state(conversation, assistant_response, db)
+        
+        return response, user_msg, assistant_msg
+    
     async def _get_or_create_conversation(self, loan_id: int, session_id: str,
                                         channel: ConversationChannel,
-                                        db: Session) -> Conversation:
+                                        db: AsyncSession) -> Conversation:
         """Get existing conversation or create new one"""
         
         # Try to find existing active conversation
-        conversation = db.query(Conversation).filter(
-            and_(
-                Conversation.loan_id == loan_id,
-                Conversation.conversation_id == session_id,
-                Conversation.state.notin_([ConversationState.CLOSED, ConversationState.OPTED_OUT])
+        result = await db.execute(
+            select(Conversation).where(
+                and_(
+                    Conversation.loan_id == loan_id,
+                    Conversation.conversation_id == session_id,
+                    Conversation.state.notin_([ConversationState.CLOSED, ConversationState.OPTED_OUT])
+                )
             )
-        ).first()
+        )
+        conversation = result.scalars().first()
         
         if conversation:
             # Update last activity
@@ -159,7 +272,7 @@ class ConversationService:
             return conversation
         
         # Create new conversation
-        loan = db.query(Loan).filter(Loan.id == loan_id).first()
+        loan = await db.get(Loan, loan_id)
         if not loan:
             raise ValueError(f"Loan {loan_id} not found")
         
@@ -168,36 +281,49 @@ class ConversationService:
             borrower_id=loan.borrower_id,
             loan_id=loan_id,
             state=ConversationState.INITIATED,
-            channel=channel.value,
+            channel=ChannelType(channel.value),
             session_data={},
             identity_verified=False,
             verification_attempts=0
         )
         
         db.add(conversation)
-        db.flush()  # Get the ID
+        
+        # Keep the borrower's denormalized contact times current
+        await compliance_service.record_contact(loan.borrower_id, db)
+        
+        await db.flush()  # Get the ID
         
         logger.info(f"Created new conversation: {conversation.conversation_id}")
         return conversation
     
     async def _build_conversation_context(self, conversation: Conversation,
-                                        db: Session) -> Dict[str, Any]:
+                                        db: AsyncSession) -> Dict[str, Any]:
         """Build conversation context for LLM processing"""
         
-        # Get recent messages
-        recent_messages = db.query(Message).filter(
-            Message.conversation_id == conversation.id
-        ).order_by(desc(Message.created_at)).limit(10).all()
-        
-        # Format message history
-        message_history = []
-        for msg in reversed(recent_messages):  # Reverse to get chronological order
-            message_history.append({
-                'role': msg.message_type.value,
-                'content': msg.content,
-                'timestamp': msg.created_at.isoformat(),
-                'metadata': msg.metadata
-            })
+        cached = self._message_history_cache.get(conversation.id)
+        if cached and cached[0] > time.monotonic() and cached[1] == conversation.version:
+            message_history = list(cached[2])
+        else:
+            # Get recent messages; only the columns the prompt uses, so the
+            # JSONB metadata blob is not fetched or decoded per row
+            result = await db.execute(
+                select(Message.message_type, Message.content, Message.created_at).where(
+                    Message.conversation_id == conversation.id
+                ).order_by(desc(Message.created_at)).limit(self.message_history_length)
+            )
+            recent_messages = result.all()
+            
+            # Format message history (reversed to get chronological order)
+            message_history = [self._format_history_message(msg) for msg in reversed(recent_messages)]
+            
+            if len(self._message_history_cache) >= self.message_history_cache_size:
+                self._message_history_cache.pop(next(iter(self._message_history_cache)))
+            self._message_history_cache[conversation.id] = (
+                time.monotonic() + self.message_history_ttl,
+                conversation.version,
+                deque(message_history, maxlen=self.message_history_length)
+            )
         
         return {
             'conversation_id': conversation.conversation_id,
@@ -206,13 +332,13 @@ class ConversationService:
             'verification_attempts': conversation.verification_attempts,
             'session_data': conversation.session_data or {},
             'recent_messages': message_history,
-            'channel': conversation.channel,
+            'channel': conversation.channel.value,
             'last_activity': conversation.last_activity.isoformat()
         }
     
     async def _handle_assistant_action(self, assistant_response: AssistantResponse,
                                      conversation: Conversation, loan: Loan,
-                                     borrower: Borrower, db: Session) -> ConversationResponse:
+                                     borrower: Borrower, db: AsyncSession) -> ConversationResponse:
         """Handle specific assistant actions and generate appropriate response"""
         
         requires_action = False
@@ -221,7 +347,10 @@ class ConversationService:
         # Handle escalation
         if assistant_response.escalation:
             await self._escalate_conversation(
-                conversation, assistant_response.metadata.get('escalation_reason', 'LLM requested escalation'), db
+                conversation,
+                (assistant_response.metadata and assistant_response.metadata.escalation_reason)
+                or 'LLM requested escalation',
+                db
             )
             next_steps.append("Conversation escalated to human agent")
         
@@ -253,21 +382,17 @@ class ConversationService:
         )
     
     async def _create_payment_plan(self, loan: Loan, conversation: Conversation,
-                                 structured_plan, db: Session) -> int:
+                                 structured_plan, db: AsyncSession) -> int:
         """Create a payment plan from structured plan data"""
         
-        plan_type_map = {
-            'installment': PaymentPlanType.INSTALLMENT,
-            'settlement': PaymentPlanType.SETTLEMENT,
-            'one_time': PaymentPlanType.FULL_PAYMENT
-        }
+        plan_type = structured_plan.type
         
         payment_plan = PaymentPlan(
             loan_id=loan.id,
             conversation_id=conversation.id,
-            plan_type=plan_type_map[structured_plan.type.value],
+            plan_type=_PLAN_TYPE_MAP[plan_type],
             total_amount=structured_plan.amount,
-            installment_amount=structured_plan.amount if structured_plan.type.value == 'one_time' else structured_plan.amount,
+            installment_amount=structured_plan.amount,
             number_of_installments=structured_plan.installments or 1,
             first_payment_date=datetime.fromisoformat(structured_plan.first_due_date) if structured_plan.first_due_date else datetime.utcnow() + timedelta(days=7),
             payment_frequency=structured_plan.frequency or 'monthly',
@@ -275,61 +400,66 @@ class ConversationService:
         )
         
         db.add(payment_plan)
-        db.flush()
+        await db.flush()
         
         # Create scheduled payments for installment plans
-        if structured_plan.type.value == 'installment' and structured_plan.installments:
+        if plan_type == PlanType.INSTALLMENT and structured_plan.installments:
             await self._create_scheduled_payments(payment_plan, db)
         
         logger.info(f"Created payment plan {payment_plan.id} for loan {loan.id}")
         return payment_plan.id
     
-    async def _create_scheduled_payments(self, payment_plan: PaymentPlan, db: Session):
+    async def _create_scheduled_payments(self, payment_plan: PaymentPlan, db: AsyncSession):
         """Create scheduled payment records for installment plans"""
         
-        current_date = payment_plan.first_payment_date
-        
-        for i in range(payment_plan.number_of_installments):
-            scheduled_payment = ScheduledPayment(
-                payment_plan_id=payment_plan.id,
-                installment_number=i + 1,
-                due_date=current_date,
-                amount=payment_plan.installment_amount,
-                status='pending'
-            )
-            
-            db.add(scheduled_payment)
-            
-            # Calculate next payment date based on frequency
-            if payment_plan.payment_frequency == 'weekly':
-                current_date += timedelta(weeks=1)
-            elif payment_plan.payment_frequency == 'bi-weekly':
-                current_date += timedelta(weeks=2)
-            else:  # monthly
-                # Add one month (approximate)
-                if current_date.month == 12:
-                    current_date = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    current_date = current_date.replace(month=current_date.month + 1)
+        first_date = payment_plan.first_payment_date
+        
+        # Due dates are offsets from the first payment so monthly plans keep
+        # their day of month instead of drifting after a short month
+        if payment_plan.payment_frequency == 'weekly':
+            due_dates = [first_date + timedelta(weeks=i) for i in range(payment_plan.number_of_installments)]
+        elif payment_plan.payment_frequency == 'bi-weekly':
+            due_dates = [first_date + timedelta(weeks=2 * i) for i in range(payment_plan.number_of_installments)]
+        else:  # monthly
+            due_dates = [self._add_months(first_date, i) for i in range(payment_plan.number_of_installments)]
+        
+        # One multi-row INSERT for the whole schedule
+        await db.execute(
+            insert(ScheduledPayment),
+            [
+                {
+                    "payment_plan_id": payment_plan.id,
+                    "installment_number": i + 1,
+                    "due_date": due_date,
+                    "amount": payment_plan.installment_amount,
+                    "status": "pending"
+                }
+                for i, due_date in enumerate(due_dates)
+            ]
+        )
     
-    async def _escalate_conversation(self, conversation: Conversation, reason: str, db: Session):
+    @staticmethod
+    def _add_months(date: datetime, months: int) -> datetime:
+        """Add calendar months, clamping to the last day of shorter months"""
+        month_index = date.month - 1 + months
+        year, month = date.year + month_index // 12, month_index % 12 + 1
+        day = min(date.day, calendar.monthrange(year, month)[1])
+        return date.replace(year=year, month=month, day=day)
+    
+    async def _escalate_conversation(self, conversation: Conversation, reason: str, db: AsyncSession):
         """Escalate conversation to human agent"""
         
         conversation.state = ConversationState.ESCALATED
         conversation.escalation_reason = reason
         conversation.escalation_date = datetime.utcnow()
         
-        # Log escalation event
-        log_escalation_event(
-            conversation_id=conversation.conversation_id,
-            reason=reason,
-            confidence_score=0.0
-        )
+        # Log escalation event off the request path
+        enqueue_event(log_escalation_event, conversation.conversation_id, reason, 0.0)
         
         logger.info(f"Escalated conversation {conversation.conversation_id}: {reason}")
     
     async def _update_conversation_state(self, conversation: Conversation,
-                                       assistant_response: AssistantResponse, db: Session):
+                                       assistant_response: AssistantResponse, db: AsyncSession):
         """Update conversation state based on assistant response"""
         
         if assistant_response.escalation:
@@ -343,19 +473,18 @@ class ConversationService:
         
         conversation.last_activity = datetime.utcnow()
     
-    async def _log_compliance_events(self, conversation: Conversation,
-                                   assistant_response: AssistantResponse,
-                                   borrower_id: int, loan_id: int):
-        """Log compliance-related events"""
+    def _log_compliance_events(self, conversation_id: str, compliance_checks: tuple,
+                               action: str, confidence: float, borrower_id: int, loan_id: int):
+        """Log compliance-related events (runs on the background event task)"""
         
-        for check in assistant_response.compliance_checks:
+        for check in compliance_checks:
             log_compliance_event(
                 event_type=f"compliance_check_{check}",
                 details={
                     'check_name': check,
-                    'conversation_id': conversation.conversation_id,
-                    'action': assistant_response.action.value,
-                    'confidence': assistant_response.confidence
+                    'conversation_id': conversation_id,
+                    'action': action,
+                    'confidence': confidence
                 },
                 user_id=str(borrower_id),
                 loan_id=str(loan_id)
@@ -367,13 +496,7 @@ class ConversationService:
         return ConversationResponse(
             ok=False,
             conversation_id=conversation_id,
-            assistant=AssistantResponse(
-                action=ActionType.CLOSE,
-                message_to_user="This contact has opted out of communications. No further messages will be sent.",
-                confidence=1.0,
-                escalation=False,
-                compliance_checks=["opt_out_respected"]
-            ),
+            assistant=_OPTED_OUT_ASSISTANT,
             requires_action=False
         )
     
@@ -383,65 +506,84 @@ class ConversationService:
         return ConversationResponse(
             ok=False,
             conversation_id=conversation_id,
-            assistant=AssistantResponse(
-                action=ActionType.CLOSE,
-                message_to_user=f"Contact not allowed at this time: {reason}",
-                confidence=1.0,
-                escalation=False,
-                compliance_checks=["contact_time_restriction"]
-            ),
+            assistant=_compliance_blocked_assistant(reason),
             requires_action=False
         )
     
     async def verify_identity(self, conversation_id: str, verification_data: Dict[str, str],
-                            db: Session) -> Dict[str, Any]:
+                            db: AsyncSession) -> Dict[str, Any]:
         """Verify borrower identity using provided data"""
         
-        conversation = db.query(Conversation).filter(
-            Conversation.conversation_id == conversation_id
-        ).first()
+        # Conversation, loan and borrower in one round-trip
+        result = await db.execute(
+            select(Conversation, Loan, Borrower).join(
+                Loan, Conversation.loan_id == Loan.id
+            ).join(
+                Borrower, Conversation.borrower_id == Borrower.id
+            ).where(Conversation.conversation_id == conversation_id)
+        )
+        row = result.first()
         
-        if not conversation:
+        if not row:
             raise ValueError("Conversation not found")
+        conversation, loan, borrower = row
         
-        loan = db.query(Loan).filter(Loan.id == conversation.loan_id).first()
-        borrower = db.query(Borrower).filter(Borrower.id == conversation.borrower_id).first()
+        # Verify identity. Every supplied factor is evaluated and the results
+        # combined before branching, and the SSN comparison is constant-time,
+        # so response timing does not reveal which factor failed.
+        ssn_ok = True
+        if "last_four_ssn" in verification_data:
+            ssn_ok = hmac.compare_digest(
+                str(verification_data["last_four_ssn"]).encode(),
+                (borrower.ssn_last_four or "").encode()
+            )
         
-        # Check verification attempts
-        if conversation.verification_attempts >= self.max_verification_attempts:
+        # Check last payment amount, compared in whole cents
+        amount_ok = True
+        if "last_payment_amount" in verification_data:
+            try:
+                provided_cents = round(float(verification_data["last_payment_amount"]) * 100)
+                amount_ok = provided_cents == round((loan.last_payment_amount or 0) * 100)
+            except (ValueError, OverflowError):
+                amount_ok = False
+        
+        verification_passed = ssn_ok & amount_ok
+        
+        # Count the attempt and apply the outcome in one guarded UPDATE. The
+        # increment happens in the database, so concurrent attempts cannot
+        # both read the same count and slip past the attempt limit.
+        values = {
+            "verification_attempts": Conversation.verification_attempts + 1,
+            "version": Conversation.version + 1
+        }
+        if verification_passed:
+            values["identity_verified"] = True
+            values["state"] = ConversationState.ACTIVE_NEGOTIATION
+        result = await db.execute(
+            update(Conversation).where(
+                Conversation.id == conversation.id,
+                Conversation.verification_attempts < self.max_verification_attempts
+            ).values(**values).returning(Conversation.verification_attempts),
+            execution_options={"synchronize_session": False}
+        )
+        attempts = result.scalar_one_or_none()
+        
+        if attempts is None:
+            # Limit already reached
             await self._escalate_conversation(
                 conversation, "Maximum verification attempts exceeded", db
             )
-            db.commit()
+            await db.commit()
+            self.invalidate_loan_conversations(conversation.loan_id)
             return {
                 "verified": False,
                 "message": "Maximum verification attempts exceeded. Escalating to human agent.",
                 "attempts_remaining": 0
             }
         
-        # Verify identity
-        verification_passed = True
-        
-        # Check last 4 digits of SSN
-        if "last_four_ssn" in verification_data:
-            if verification_data["last_four_ssn"] != borrower.ssn_last_four:
-                verification_passed = False
-        
-        # Check last payment amount
-        if "last_payment_amount" in verification_data:
-            try:
-                provided_amount = float(verification_data["last_payment_amount"])
-                if abs(provided_amount - (loan.last_payment_amount or 0)) > 0.01:
-                    verification_passed = False
-            except ValueError:
-                verification_passed = False
-        
-        conversation.verification_attempts += 1
+        attempts_remaining = self.max_verification_attempts - attempts
         
         if verification_passed:
-            conversation.identity_verified = True
-            conversation.state = ConversationState.ACTIVE_NEGOTIATION
-            
             log_compliance_event(
                 event_type="identity_verified",
                 details={"verification_method": list(verification_data.keys())},
@@ -449,23 +591,22 @@ class ConversationService:
                 loan_id=str(loan.id)
             )
             
-            db.commit()
+            await db.commit()
+            self.invalidate_loan_conversations(conversation.loan_id)
             return {
                 "verified": True,
                 "message": "Identity verified successfully.",
-                "attempts_remaining": self.max_verification_attempts - conversation.verification_attempts
+                "attempts_remaining": attempts_remaining
             }
         else:
-            attempts_remaining = self.max_verification_attempts - conversation.verification_attempts
-            
             log_compliance_event(
                 event_type="identity_verification_failed",
-                details={"attempt_number": conversation.verification_attempts},
+                details={"attempt_number": attempts},
                 user_id=str(borrower.id),
                 loan_id=str(loan.id)
             )
             
-            db.commit()
+            await db.commit()
             return {
                 "verified": False,
                 "message": f"Identity verification failed. {attempts_remaining} attempts remaining.",
@@ -473,11 +614,11 @@ class ConversationService:
             }
     
     async def process_payment(self, loan_id: int, amount: float, payment_method: str,
-                            conversation_id: str, metadata: Dict[str, Any] = None,
-                            db: Session = None) -> Dict[str, Any]:
+                            conversation_id: str, metadata: Optional[PaymentMetadata] = None,
+                            db: AsyncSession = None) -> Dict[str, Any]:
         """Process a payment for a loan"""
         
-        loan = db.query(Loan).filter(Loan.id == loan_id).first()
+        loan = await db.get(Loan, loan_id)
         if not loan:
             raise ValueError(f"Loan {loan_id} not found")
         
@@ -489,7 +630,7 @@ class ConversationService:
             transaction_type=TransactionType.PAYMENT,
             description=f"Payment via {payment_method}",
             payment_method=payment_method,
-            metadata=metadata
+            external_reference=metadata.external_reference if metadata else None
         )
         
         db.add(transaction)
@@ -499,16 +640,24 @@ class ConversationService:
         loan.last_payment_date = datetime.utcnow()
         loan.last_payment_amount = amount
         
-        # Log payment event
-        log_payment_event(
-            loan_id=str(loan_id),
-            amount=amount,
-            payment_method=payment_method,
-            status="completed",
-            transaction_id=transaction.transaction_id
+        # Log payment event off the request path
+        enqueue_event(
+            log_payment_event, str(loan_id), amount, payment_method,
+            "completed", transaction.transaction_id
         )
         
-        db.commit()
+        await db.commit()
+        
+        # The payment is committed: cache invalidation must not fail the
+        # request, or a retrying client pays twice. Other workers' RAG context
+        # is keyed on the loan's updated_at, so it goes stale on its own; the
+        # LLM service is only touched here if this worker already built it.
+        try:
+            get_rag_service().invalidate_borrower_context(loan_id, loan.borrower_id)
+            if get_llm_service.cache_info().currsize:
+                get_llm_service().invalidate_rag_context(loan_id)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached context for loan {loan_id}: {e}")
         
         return {
             "status": "completed",
@@ -519,12 +668,13 @@ class ConversationService:
     
     async def escalate_to_human(self, conversation_id: str, reason: str,
                               priority: str = "normal", notes: str = None,
-                              db: Session = None) -> Dict[str, Any]:
+                              db: AsyncSession = None) -> Dict[str, Any]:
         """Escalate conversation to human agent"""
         
-        conversation = db.query(Conversation).filter(
-            Conversation.conversation_id == conversation_id
-        ).first()
+        result = await db.execute(
+            select(Conversation).where(Conversation.conversation_id == conversation_id)
+        )
+        conversation = result.scalars().first()
         
         if not conversation:
             raise ValueError("Conversation not found")
@@ -546,7 +696,8 @@ class ConversationService:
         )
         
         db.add(audit_log)
-        db.commit()
+        await db.commit()
+        self.invalidate_loan_conversations(conversation.loan_id)
         
         return {
             "status": "escalated",
@@ -555,35 +706,54 @@ class ConversationService:
             "estimated_response_time": "2-4 hours" if priority == "high" else "24-48 hours"
         }
     
-    async def get_conversation(self, conversation_id: str, db: Session) -> Optional[Dict[str, Any]]:
-        """Get conversation details and history"""
-        
-        conversation = db.query(Conversation).filter(
-            Conversation.conversation_id == conversation_id
-        ).first()
+    async def get_conversation(self, conversation_id: str, db: AsyncSession,
+                               limit: int = 200,
+                               before_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get conversation details and one page of message history"""
         
+        conversation = await self.get_conversation_header(conversation_id, db)
         if not conversation:
             return None
         
-        # Get messages
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation.id
-        ).order_by(Message.created_at).all()
+        messages = [
+            message
+            async for batch in self.iter_messages(
+                conversation["conversation"]["id"], db, limit=limit, before_id=before_id
+            )
+            for message in batch
+        ]
+        conversation["messages"] = messages
+        conversation["next_before_id"] = messages[0]["id"] if len(messages) == limit else None
+        return conversation
+    
+    async def get_conversation_header(self, conversation_id: str,
+                                      db: AsyncSession) -> Optional[Dict[str, Any]]:
+        """Get conversation, borrower and loan details without the message history"""
+        
+        # Conversation, loan and borrower in one round-trip
+        result = await db.execute(
+            select(Conversation, Loan, Borrower).join(
+                Loan, Conversation.loan_id == Loan.id
+            ).join(
+                Borrower, Conversation.borrower_id == Borrower.id
+            ).where(Conversation.conversation_id == conversation_id)
+        )
+        row = result.first()
         
-        # Get loan and borrower info
-        loan = db.query(Loan).filter(Loan.id == conversation.loan_id).first()
-        borrower = db.query(Borrower).filter(Borrower.id == conversation.borrower_id).first()
+        if not row:
+            return None
+        conversation, loan, borrower = row
         
         return {
             "conversation": ConversationInfo(
                 id=conversation.id,
                 conversation_id=conversation.conversation_id,
                 state=conversation.state.value,
-                channel=conversation.channel,
+                channel=conversation.channel.value,
                 identity_verified=conversation.identity_verified,
                 last_activity=conversation.last_activity,
                 assigned_agent_id=conversation.assigned_agent_id
-            ).dict(),
+            ).model_dump(),
             "borrower": BorrowerInfo(
                 id=borrower.id,
                 name=borrower.name,
@@ -591,7 +761,7 @@ class ConversationService:
                 phone=borrower.phone,
                 consent_status=borrower.consent_status.value,
                 preferred_contact_method=borrower.preferred_contact_method
-            ).dict(),
+            ).model_dump(),
             "loan": LoanInfo(
                 id=loan.id,
                 account_number=loan.account_number,
@@ -602,36 +772,116 @@ class ConversationService:
                 days_overdue=loan.days_overdue,
                 last_payment_date=loan.last_payment_date,
                 last_payment_amount=loan.last_payment_amount
-            ).dict(),
-            "messages": [
-                MessageInfo(
+            ).model_dump()
+        }
+    
+    async def iter_messages(self, conversation_pk: int, db: AsyncSession,
+                            limit: int = 200, before_id: Optional[int] = None,
+                            batch_size: int = 100) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield one page of a conversation's messages in chronological batches
+        
+        The page is the `limit` most recent messages older than `before_id`
+        (or the newest ones when omitted), read via a server-side cursor.
+        Older history is fetched by passing the oldest id seen as `before_id`.
+        """
+        
+        page = select(Message.id).where(Message.conversation_id == conversation_pk)
+        if before_id is not None:
+            page = page.where(Message.id < before_id)
+        page = page.order_by(Message.id.desc()).limit(limit)
+        
+        result = await db.stream(
+            select(Message).where(
+                Message.id.in_(page.scalar_subquery())
+            ).order_by(Message.id).execution_options(yield_per=batch_size)
+        )
+        
+        async for partition in result.scalars().partitions():
+            yield [
+                msgspec.structs.asdict(MessageInfo(
                     id=msg.id,
                     message_type=msg.message_type.value,
                     content=msg.content,
                     confidence_score=msg.confidence_score,
                     created_at=msg.created_at
-                ).dict() for msg in messages
+                )) for msg in partition
             ]
-        }
     
-    async def get_loan_conversations(self, loan_id: int, db: Session) -> List[Dict[str, Any]]:
+    async def get_loan_conversations(self, loan_id: int, db: AsyncSession) -> List[Dict[str, Any]]:
         """Get all conversations for a specific loan"""
         
-        conversations = db.query(Conversation).filter(
-            Conversation.loan_id == loan_id
-        ).order_by(desc(Conversation.created_at)).all()
-        
-        return [
-            ConversationInfo(
-                id=conv.id,
-                conversation_id=conv.conversation_id,
-                state=conv.state.value,
-                channel=conv.channel,
-                identity_verified=conv.identity_verified,
-                last_activity=conv.last_activity,
-                assigned_agent_id=conv.assigned_agent_id
-            ).dict() for conv in conversations
+        cached = self._loan_conversations_cache.get(loan_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        # Only the listed columns, streamed in chunks and emitted as plain dicts
+        # in ConversationInfo's shape; no ORM objects or per-row model validation
+        result = await db.stream(
+            select(
+                Conversation.id,
+                Conversation.conversation_id,
+                Conversation.state,
+                Conversation.channel,
+                Conversation.identity_verified,
+                Conversation.last_activity,
+                Conversation.assigned_agent_id
+            ).where(
+                Conversation.loan_id == loan_id
+            ).order_by(desc(Conversation.created_at)).execution_options(yield_per=500)
+        )
+        
+        loan_conversations = [
+            {
+                "id": row.id,
+                "conversation_id": row.conversation_id,
+                "state": row.state.value,
+                "channel": row.channel.value,
+                "identity_verified": row.identity_verified,
+                "last_activity": row.last_activity,
+                "assigned_agent_id": row.assigned_agent_id
+            }
+            async for row in result
         ]
+        
+        if len(self._loan_conversations_cache) >= self.loan_conversations_cache_size:
+            # Evict the oldest entry (dicts preserve insertion order)
+            self._loan_conversations_cache.pop(next(iter(self._loan_conversations_cache)))
+        self._loan_conversations_cache[loan_id] = (
+            time.monotonic() + self.loan_conversations_ttl, loan_conversations
+        )
+        return loan_conversations
+    
+    @staticmethod
+    def _format_history_message(msg) -> MessageTurn:
+        """Format a message (ORM object or column row) for the LLM context window"""
+        return MessageTurn(
+            role=msg.message_type.value,
+            content=msg.content,
+            created_at=msg.created_at
+        )
+    
+    def _append_message_history(self, conversation_pk: int, seen_version: int,
+                                new_version: int, *messages: Message):
+        """
+        Extend a cached context window with newly committed messages
+        
+        Only when this turn's commit was the one change since the window was
+        read; otherwise another turn may be missing from it, and it is dropped.
+        """
+        cached = self._message_history_cache.get(conversation_pk)
+        if not cached:
+            return
+        if cached[0] > time.monotonic() and cached[1] == seen_version and new_version == seen_version + 1:
+            history: Deque[MessageTurn] = cached[2]
+            history.extend(self._format_history_message(msg) for msg in messages)
+            self._message_history_cache[conversation_pk] = (cached[0], new_version, history)
+        else:
+            self._message_history_cache.pop(conversation_pk, None)
+    
+    def invalidate_loan_conversations(self, loan_id: int):
+        """Drop the cached conversation list for a loan after a write"""
+        self._loan_conversations_cache.pop(loan_id, None)
     
     # Logging helper methods
     def log_conversation_event(self, conversation_id: str, message_type: str, 
@@ -639,6 +889,14 @@ class ConversationService:
         """Log conversation event"""
         log_conversation_event(conversation_id, message_type, content, metadata)
     
+    def log_conversation_events(self, events: List[Dict[str, Any]]):
+        """Log several conversation events from a single background task"""
+        for event in events:
+            log_conversation_event(
+                event['conversation_id'], event['message_type'],
+                event['content'], event.get('metadata')
+            )
+    
     def log_payment_event(self, loan_id: str, amount: float, payment_method: str,
                          status: str, transaction_id: str = None, error: str = None):
         """Log payment event"""
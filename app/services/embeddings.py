@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import List, Optional
+from sentence_transformers import SentenceTransformer
+
+# Processes used to encode large corpora (index rebuilds) on CPU hosts
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0")) or os.cpu_count() or 1
+# Texts per task handed to a worker
+EMBEDDING_WORKER_GROUP_SIZE = 1000
+
+# Kept free of the service modules: pool workers import this module, and
+# must not construct the RAG service (index, Redis) as a side effect
+_worker_model: Optional[SentenceTransformer] = None
+
+
+def load_embedding_model(model_name: str) -> SentenceTransformer:
+    """Load the sentence embedding model on the best available device"""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = SentenceTransformer(model_name, device=device)
+    if device == "cuda" and os.getenv("EMBEDDING_FP16", "true").lower() == "true":
+        # Half precision on GPU (tensor cores); encode_texts() output is cast
+        # back to float32 for FAISS
+        model.half()
+    elif device == "cpu" and os.getenv("EMBEDDING_INT8", "false").lower() == "true":
+        # Dynamic int8 quantization of the transformer's Linear layers;
+        # several times faster CPU encodes at negligible retrieval loss.
+        # Opt-in: queries must be embedded like the persisted index was, so
+        # rebuild_index() after switching it on or off
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model
+
+
+def encode_texts(model: SentenceTransformer, texts: List[str], batch_size: int = 64) -> np.ndarray:
+    """Embed texts in batches as unit-length float32 vectors"""
+    return model.encode(
+        texts, batch_size=batch_size, convert_to_numpy=True,
+        normalize_embeddings=True, show_progress_bar=False
+    ).astype('float32')
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    # Split the cores between workers instead of every worker using all of them
+    torch.set_num_threads(threads)
+    _worker_model = load_embedding_model(model_name)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return encode_texts(_worker_model, texts, batch_size=128)
+
+
+def start_encode_pool(model_name: str, workers: int = EMBEDDING_WORKERS) -> ProcessPoolExecutor:
+    """Start worker processes that each load their own copy of the model"""
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    # spawn: forking a process that already holds torch/FAISS threads is unsafe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                               initializer=_init_worker, initargs=(model_name, threads))
+
+
+def encode_parallel(pool: ProcessPoolExecutor, texts: List[str]) -> np.ndarray:
+    """
+    Embed texts across an encode pool
+
+    Returns the same vectors, in the same order, as encode_texts().
+    """
+    groups = [
+        texts[start:start + EMBEDDING_WORKER_GROUP_SIZE]
+        for start in range(0, len(texts), EMBEDDING_WORKER_GROUP_SIZE)
+    ]
+    return np.vstack(list(pool.map(_encode_in_worker, groups)))
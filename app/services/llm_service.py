@@ -1,18 +1,118 @@
 import os
-import json
-import time
 import re
-from typing import Dict, Any, Optional, List
+import time
+import asyncio
+import orjson
+import numpy as np
+import tiktoken
+from contextlib import aclosing, closing
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional, List
 from datetime import datetime
 from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
-from ..models.pydantic_models import AssistantResponse, StructuredPlan, ActionType, PlanType
-from ..services.rag_service import rag_service
+from ..models.pydantic_models import (
+    AssistantResponse, AssistantMetadata, StructuredPlan, ActionType, PlanType
+)
+from ..services.rag_service import get_rag_service
 from ..utils.logging_config import get_logger, log_llm_interaction, log_compliance_event
 
 logger = get_logger(__name__)
 
+# Keyword -> policy search query for RAG retrieval, in priority order
+_POLICY_KEYWORDS: Mapping[str, str] = MappingProxyType({
+    'payment plan': 'payment plan installment policy',
+    'settlement': 'settlement offer policy',
+    'dispute': 'debt validation dispute policy',
+    'lawyer': 'legal escalation policy',
+    'bankruptcy': 'bankruptcy escalation policy',
+    'harassment': 'harassment complaint policy',
+    'stop': 'opt out communication policy'
+})
+_POLICY_KEYWORD_RE = re.compile("|".join(map(re.escape, _POLICY_KEYWORDS)), re.IGNORECASE)
+
+# Response screening patterns (case-insensitive substring matches)
+_PROHIBITED_WORDS = ('threaten', 'sue', 'arrest', 'jail', 'garnish', 'seize')
+_PROHIBITED_RE = re.compile("|".join(_PROHIBITED_WORDS), re.IGNORECASE)
+_ACCOUNT_DETAIL_RE = re.compile(r"balance|\$", re.IGNORECASE)
+
+# Splits the few-shot block into its "EXAMPLE n - ..." sections
+_FEW_SHOT_SPLIT_RE = re.compile(r"^(?=EXAMPLE \d+)", re.MULTILINE)
+
+
+def _find_json_span(text: str, start: int = 0) -> Optional[tuple]:
+    """
+    Locate the first balanced {...} object at or after `start`
+    
+    Single pass tracking brace depth and string/escape state, so braces
+    inside string values and nested objects (structured_plan) are handled.
+    Returns (start, end) slice bounds, or None if no complete object exists.
+    """
+    begin = text.find("{", start)
+    if begin < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(begin, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return begin, i + 1
+    return None
+
+
+def _compact_json_blocks(text: str) -> str:
+    """Re-emit every JSON object in `text` without indentation or spacing"""
+    parts = []
+    pos = 0
+    span = _find_json_span(text)
+    while span:
+        block = text[span[0]:span[1]]
+        try:
+            block = orjson.dumps(orjson.loads(block)).decode()
+        except orjson.JSONDecodeError:
+            pass
+        parts.append(text[pos:span[0]])
+        parts.append(block)
+        pos = span[1]
+        span = _find_json_span(text, pos)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _extract_response_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode the first balanced object carrying an "action" key, starting at
+    the ```json fence when the model used one
+    """
+    fence = text.find("```json")
+    span = _find_json_span(text, fence if fence >= 0 else 0)
+    while span:
+        try:
+            candidate = orjson.loads(text[span[0]:span[1]])
+        except orjson.JSONDecodeError:
+            candidate = None
+        if isinstance(candidate, dict) and "action" in candidate:
+            return candidate
+        span = _find_json_span(text, span[0] + 1)
+    return None
+
 
 class LLMService:
     """
@@ -39,12 +139,79 @@ class LLMService:
             timeout=30
         )
         
+        # Embeddings for few-shot selection, and the
+        # retrieval context for each turn
+        self.rag_service = get_rag_service()
+        
+        # Business rule limits, read once
+        self.max_settlement_percentage = float(os.getenv("MAX_SETTLEMENT_PERCENTAGE", "0.70"))
+        self.max_installment_months = int(os.getenv("MAX_INSTALLMENT_MONTHS", "12"))
+        
         # Load prompt templates
         self.system_prompt = self._load_system_prompt()
-        self.few_shot_examples = self._load_few_shot_examples()
+        # Example JSON is sent compact; the indentation only cost tokens
+        self.few_shot_examples = _compact_json_blocks(self._load_few_shot_examples())
+        
+        # Byte-identical leading message on every call, so provider-side
+        # prompt-prefix caching can reuse it across turns and conversations
+        self._static_prefix = SystemMessage(content=self.system_prompt)
+        # Token count of the prefix, computed once; per-call logging only
+        # tokenizes the dynamic messages and the reply
+        self._tokenizer = self._load_tokenizer()
+        self._static_prefix_tokens = self._count_tokens(self._static_prefix.content)
+        
+        # Few-shot examples are picked per message by embedding similarity;
+        # each example is a fixed message, so system prompt + example is
+        # still one of a handful of cacheable prefixes
+        self.few_shot_k = int(os.getenv("LLM_FEW_SHOT_EXAMPLES", "1"))
+        self._few_shot_messages: List[SystemMessage] = []
+        self._few_shot_embeddings: Optional[np.ndarray] = None
+        self._all_few_shot = SystemMessage(content=self.few_shot_examples)
+        self._init_few_shot_selection()
+        
+        # Per-process cache of assembled RAG context and its prompt text:
+        # (loan_id, borrower_id, account version, policy query) -> (expires_at, rag_context).
+        # The account version is the loan's updated_at, so a payment taken by
+        # any worker changes the key everywhere
+        self.rag_context_ttl = float(os.getenv("RAG_CONTEXT_CACHE_TTL", "30"))
+        self.rag_context_cache_size = 1024
+        self._rag_context_cache: Dict[tuple, tuple] = {}
         
         logger.info("LLM Service initialized with ChatGroq")
     
+    def _init_few_shot_selection(self):
+        """Split the few-shot examples and embed their scenarios once"""
+        examples = [
+            example.strip() for example in _FEW_SHOT_SPLIT_RE.split(self.few_shot_examples)
+            if example.strip()
+        ]
+        if not 0 < self.few_shot_k < len(examples):
+            return
+        
+        try:
+            # Embed the context and user line only; the response JSON is
+            # boilerplate shared by every example
+            scenarios = [example.split("Response JSON:")[0] for example in examples]
+            self._few_shot_embeddings = self.rag_service.encode(scenarios)
+            self._few_shot_messages = [SystemMessage(content=example) for example in examples]
+        except Exception as e:
+            logger.error(f"Error embedding few-shot examples, sending all of them: {e}")
+    
+    def _select_few_shot(self, user_message: str) -> List[SystemMessage]:
+        """Return the few-shot examples closest to the user message"""
+        if self._few_shot_embeddings is None:
+            return [self._all_few_shot]
+        
+        try:
+            scores = self._few_shot_embeddings @ self.rag_service.encode([user_message])[0]
+        except Exception as e:
+            logger.error(f"Error selecting few-shot examples: {e}")
+            return [self._all_few_shot]
+        
+        # Best matches, kept in their original order
+        best = sorted(np.argsort(scores)[-self.few_shot_k:])
+        return [self._few_shot_messages[i] for i in best]
+    
     def _load_system_prompt(self) -> str:
         """Load the system prompt template"""
         return """You are "Collecta", an AI Debt Recovery Agent designed to help borrowers resolve their outstanding debts in a professional, empathetic, and compliant manner.
@@ -186,7 +353,8 @@ Response JSON:
 """
 
     def process_conversation(self, user_message: str, conversation_context: Dict[str, Any], 
-                           loan_id: int, borrower_id: int) -> AssistantResponse:
+                           loan_id: int, borrower_id: int,
+                           account_version: Optional[datetime] = None) -> AssistantResponse:
         """
         Process a user message and generate an appropriate response
         
@@ -195,6 +363,7 @@ Response JSON:
             conversation_context: Current conversation state and history
             loan_id: Associated loan ID
             borrower_id: Associated borrower ID
+            account_version: Loan updated_at, scoping the cached RAG context
         
         Returns:
             AssistantResponse with action, message, and metadata
@@ -204,23 +373,17 @@ Response JSON:
         
         try:
             # Get RAG context
-            rag_context = self._get_rag_context(user_message, loan_id, borrower_id)
+            rag_context = self._get_rag_context(user_message, loan_id, borrower_id, account_version)
             
-            # Build the complete prompt
-            full_prompt = self._build_prompt(user_message, conversation_context, rag_context)
+            # Build the prompt messages
+            prompt_messages = self._build_prompt(user_message, conversation_context, rag_context)
             
             # Call LLM
-            response = self._call_llm(full_prompt)
+            response = self._call_llm(prompt_messages)
             
-            # Parse and validate response
-            parsed_response = self._parse_llm_response(response)
-            
-            # Validate against business rules
-            validated_response = self._validate_response(parsed_response, conversation_context)
-            
-            # Log the interaction
-            response_time = time.time() - start_time
-            self._log_llm_interaction(conversation_id, full_prompt, response, response_time)
+            validated_response = self._complete_response(
+                conversation_id, conversation_context, prompt_messages, response, start_time
+            )
             
             return validated_response
             
@@ -230,87 +393,194 @@ Response JSON:
             # Return safe fallback response
             return self._get_fallback_response(conversation_id)
     
-    def _get_rag_context(self, user_message: str, loan_id: int, borrower_id: int) -> Dict[str, Any]:
+    async def aprocess_conversation(self, user_message: str, conversation_context: Dict[str, Any],
+                                    loan_id: int, borrower_id: int,
+                                    account_version: Optional[datetime] = None) -> AssistantResponse:
+        """
+        Async variant of process_conversation for the API request path
+        
+        The two RAG lookups run concurrently in worker threads and the ChatGroq
+        call is awaited natively, so a turn does not hold a thread while it
+        waits on the provider.
+        """
+        start_time = time.time()
+        conversation_id = conversation_context.get('conversation_id', 'unknown')
+        
+        try:
+            rag_context = await self._aget_rag_context(
+                user_message, loan_id, borrower_id, account_version
+            )
+            
+            # Few-shot selection embeds the message, so build off the loop
+            prompt_messages = await asyncio.to_thread(
+                self._build_prompt, user_message, conversation_context, rag_context
+            )
+            response = await self._acall_llm(prompt_messages)
+            
+            validated_response = self._complete_response(
+                conversation_id, conversation_context, prompt_messages, response, start_time
+            )
+            
+            return validated_response
+            
+        except Exception as e:
+            logger.error(f"Error processing conversation: {e}")
+            return self._get_fallback_response(conversation_id)
+    
+    def _complete_response(self, conversation_id: str, conversation_context: Dict[str, Any],
+                           prompt_messages: List[BaseMessage], response: str,
+                           start_time: float) -> AssistantResponse:
+        """Parse, validate and log a raw LLM reply"""
+        
+        # Parse and validate response
+        parsed_response = self._parse_llm_response(response)
+        
+        # Validate against business rules
+        validated_response = self._validate_response(parsed_response, conversation_context)
+        
+        # Log the interaction
+        response_time = time.time() - start_time
+        prompt_tokens = self._static_prefix_tokens + sum(
+            self._count_tokens(message.content) for message in prompt_messages[1:]
+        )
+        self._log_llm_interaction(conversation_id, prompt_tokens, response, response_time)
+        
+        return validated_response
+    
+    def _get_rag_context(self, user_message: str, loan_id: int, borrower_id: int,
+                         account_version: Optional[datetime] = None) -> Dict[str, Any]:
         """Retrieve relevant context using RAG"""
+        policy_query = self._extract_policy_query(user_message)
+        cache_key = (loan_id, borrower_id, account_version, policy_query)
+        cached = self._rag_context_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Get borrower and loan context
-            borrower_context = rag_service.get_borrower_context(loan_id, borrower_id)
+            borrower_context = self.rag_service.get_borrower_context(loan_id, borrower_id)
             
             # Get relevant policies based on user message
-            policy_query = self._extract_policy_query(user_message)
-            policy_context = rag_service.get_policy_context(policy_query, top_k=2)
+            policy_context = self.rag_service.get_policy_context(policy_query, top_k=2)
             
-            return {
-                'borrower_context': borrower_context,
-                'policy_context': policy_context
-            }
+            return self._rag_context_put(cache_key, borrower_context, policy_context)
             
         except Exception as e:
             logger.error(f"Error retrieving RAG context: {e}")
             return {'borrower_context': {}, 'policy_context': []}
     
+    async def _aget_rag_context(self, user_message: str, loan_id: int, borrower_id: int,
+                                account_version: Optional[datetime] = None) -> Dict[str, Any]:
+        """Retrieve RAG context with the borrower and policy lookups in parallel"""
+        # The cache is only touched here on the event loop, never from threads
+        policy_query = self._extract_policy_query(user_message)
+        cache_key = (loan_id, borrower_id, account_version, policy_query)
+        cached = self._rag_context_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            borrower_context, policy_context = await asyncio.gather(
+                asyncio.to_thread(self.rag_service.get_borrower_context, loan_id, borrower_id),
+                asyncio.to_thread(self.rag_service.get_policy_context, policy_query, 2)
+            )
+            
+            return self._rag_context_put(cache_key, borrower_context, policy_context)
+            
+        except Exception as e:
+            logger.error(f"Error retrieving RAG context: {e}")
+            return {'borrower_context': {}, 'policy_context': []}
+    
+    def _rag_context_get(self, cache_key: tuple) -> Optional[Dict[str, Any]]:
+        cached = self._rag_context_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        return None
+    
+    def _rag_context_put(self, cache_key: tuple, borrower_context: Dict[str, Any],
+                         policy_context: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Assemble the RAG context with its prompt text, caching it if complete"""
+        rag_context = {
+            'borrower_context': borrower_context,
+            'policy_context': policy_context
+        }
+        rag_context['formatted_text'] = self._format_rag_context(rag_context)
+        rag_context['account_pack'] = self._build_account_pack(borrower_context.get('borrower', {}))
+        
+        # An empty borrower context means the lookup failed; retry next turn
+        if borrower_context:
+            if len(self._rag_context_cache) >= self.rag_context_cache_size:
+                self._rag_context_cache.pop(next(iter(self._rag_context_cache)))
+            self._rag_context_cache[cache_key] = (
+                time.monotonic() + self.rag_context_ttl, rag_context
+            )
+        return rag_context
+    
+    def invalidate_rag_context(self, loan_id: int):
+        """Drop cached RAG context for a loan after its balance or status changes"""
+        for cache_key in [key for key in self._rag_context_cache if key[0] == loan_id]:
+            self._rag_context_cache.pop(cache_key, None)
+    
     def _extract_policy_query(self, user_message: str) -> str:
         """Extract relevant policy query from user message"""
-        # Simple keyword-based policy mapping
-        policy_keywords = {
-            'payment plan': 'payment plan installment policy',
-            'settlement': 'settlement offer policy',
-            'dispute': 'debt validation dispute policy',
-            'lawyer': 'legal escalation policy',
-            'bankruptcy': 'bankruptcy escalation policy',
-            'harassment': 'harassment complaint policy',
-            'stop': 'opt out communication policy'
-        }
-        
-        user_lower = user_message.lower()
-        for keyword, policy_query in policy_keywords.items():
-            if keyword in user_lower:
-                return policy_query
+        # One case-insensitive scan for all keywords; when several match, the
+        # first one in _POLICY_KEYWORDS wins
+        found = {keyword.lower() for keyword in _POLICY_KEYWORD_RE.findall(user_message)}
+        if found:
+            for keyword, policy_query in _POLICY_KEYWORDS.items():
+                if keyword in found:
+                    return policy_query
         
         return 'general debt collection policy'
     
     def _build_prompt(self, user_message: str, conversation_context: Dict[str, Any], 
-                     rag_context: Dict[str, Any]) -> str:
-        """Build the complete prompt for the LLM"""
+                     rag_context: Dict[str, Any]) -> List[BaseMessage]:
+        """
+        Build the prompt messages for the LLM
         
-        # Extract borrower information
-        borrower_info = rag_context.get('borrower_context', {}).get('borrower', {})
+        Ordered from most to least stable so each call shares the longest
+        possible prefix with the previous one: static instructions, the
+        account pack (changes only when the loan does), the append-only
+        conversation history, then the per-turn retrieval and user message.
+        """
         
         # Format RAG context
-        rag_text = self._format_rag_context(rag_context)
+        rag_text = rag_context.get('formatted_text') or self._format_rag_context(rag_context)
         
-        # Build conversation history
-        conversation_history = self._format_conversation_history(conversation_context)
-        
-        # Current context
-        current_context = f"""
-CURRENT CONVERSATION:
-Borrower: {borrower_info.get('name', 'Unknown')}
-Account: {borrower_info.get('account_number', 'Unknown')}
-Balance: ${borrower_info.get('current_balance', 0):.2f}
-Days Overdue: {borrower_info.get('days_overdue', 0)}
-Last Payment: {borrower_info.get('last_payment_date', 'None')} - ${borrower_info.get('last_payment_amount', 0):.2f}
-Status: {borrower_info.get('status', 'Unknown')}
-Identity Verified: {conversation_context.get('identity_verified', False)}
-"""
-        
-        # Assemble full prompt
-        full_prompt = f"""{self.system_prompt}
-
-{self.few_shot_examples}
-
-RETRIEVED CONTEXT:
+        current_turn = f"""RETRIEVED CONTEXT:
 {rag_text}
 
-{current_context}
-
-{conversation_history}
+Identity Verified: {conversation_context.get('identity_verified', False)}
 
 USER MESSAGE: "{user_message}"
 
 Respond with the required JSON format followed by your message to the user."""
         
-        return full_prompt
+        return [
+            self._static_prefix,
+            *self._select_few_shot(user_message),
+            SystemMessage(content=self._account_pack(rag_context)),
+            *self._format_conversation_history(conversation_context),
+            HumanMessage(content=current_turn)
+        ]
+    
+    def _account_pack(self, rag_context: Dict[str, Any]) -> str:
+        """Account block for this RAG context, formatted once per cached context"""
+        account_pack = rag_context.get('account_pack')
+        if account_pack is None:
+            borrower_info = rag_context.get('borrower_context', {}).get('borrower', {})
+            account_pack = self._build_account_pack(borrower_info)
+        return account_pack
+    
+    def _build_account_pack(self, borrower_info: Dict[str, Any]) -> str:
+        """Format the borrower/account block, deterministic for a given loan state"""
+        return f"""CURRENT CONVERSATION:
+Borrower: {borrower_info.get('name', 'Unknown')}
+Account: {borrower_info.get('account_number', 'Unknown')}
+Balance: ${borrower_info.get('current_balance', 0):.2f}
+Days Overdue: {borrower_info.get('days_overdue', 0)}
+Last Payment: {borrower_info.get('last_payment_date', 'None')} - ${borrower_info.get('last_payment_amount', 0):.2f}
+Status: {borrower_info.get('status', 'Unknown')}"""
     
     def _format_rag_context(self, rag_context: Dict[str, Any]) -> str:
         """Format RAG context for inclusion in prompt"""
@@ -326,26 +596,56 @@ Respond with the required JSON format followed by your message to the user."""
         
         return '\n'.join(context_parts) if context_parts else "No additional context available."
     
-    def _format_conversation_history(self, conversation_context: Dict[str, Any]) -> str:
-        """Format recent conversation history"""
+    def _format_conversation_history(self, conversation_context: Dict[str, Any]) -> List[BaseMessage]:
+        """Format recent conversation history as chat turns"""
         messages = conversation_context.get('recent_messages', [])
         if not messages:
-            return "CONVERSATION HISTORY: This is the start of the conversation."
+            return [SystemMessage(content="CONVERSATION HISTORY: This is the start of the conversation.")]
         
-        history_parts = ["CONVERSATION HISTORY:"]
+        history = []
         for msg in messages[-5:]:  # Last 5 messages
-            role = msg.get('role', 'unknown')
-            content = msg.get('content', '')[:100]  # Truncate long messages
-            history_parts.append(f"{role.upper()}: {content}")
+            role = msg.role
+            content = msg.content[:100]  # Truncate long messages
+            if role == 'user':
+                history.append(HumanMessage(content=content))
+            elif role == 'assistant':
+                history.append(AIMessage(content=content))
+            else:
+                history.append(SystemMessage(content=f"{role.upper()}: {content}"))
+        
+        return history
+    
+    def _call_llm(self, messages: List[BaseMessage]) -> str:
+        """
+        Stream the ChatGroq reply, stopping once its JSON object is complete
         
-        return '\n'.join(history_parts)
+        Everything used downstream (including message_to_user) is in the
+        JSON; the prose the model appends after it is never read, so the
+        stream is closed there instead of waiting for the full generation.
+        """
+        try:
+            text = ""
+            with closing(self.llm.stream(messages)) as stream:
+                for chunk in stream:
+                    text += chunk.content
+                    if "}" in chunk.content and _extract_response_json(text) is not None:
+                        break
+            return text
+            
+        except Exception as e:
+            logger.error(f"Error calling LLM: {e}")
+            raise
     
-    def _call_llm(self, prompt: str) -> str:
-        """Call the ChatGroq LLM with the assembled prompt"""
+    async def _acall_llm(self, messages: List[BaseMessage]) -> str:
+        """Async variant of _call_llm; the event loop is not blocked while streaming"""
         try:
-            messages = [SystemMessage(content=prompt)]
-            response = self.llm.invoke(messages)
-            return response.content
+            text = ""
+            async with aclosing(self.llm.astream(messages)) as stream:
+                async for chunk in stream:
+                    text += chunk.content
+                    if "}" in chunk.content and _extract_response_json(text) is not None:
+                        break
+            return text
             
         except Exception as e:
             logger.error(f"Error calling LLM: {e}")
@@ -354,39 +654,19 @@ Respond with the required JSON format followed by your message to the user."""
     def _parse_llm_response(self, response: str) -> AssistantResponse:
         """Parse the LLM response and extract JSON"""
         try:
-            # Extract JSON block from response
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
-            if not json_match:
-                # Try to find JSON without code blocks
-                json_match = re.search(r'(\{[^}]*"action"[^}]*\})', response, re.DOTALL)
-            
-            if not json_match:
+            parsed_json = _extract_response_json(response)
+            if parsed_json is None:
                 raise ValueError("No valid JSON found in LLM response")
             
-            json_str = json_match.group(1)
-            parsed_json = json.loads(json_str)
-            
-            # Convert to AssistantResponse
-            structured_plan = None
-            if parsed_json.get('structured_plan'):
-                plan_data = parsed_json['structured_plan']
-                structured_plan = StructuredPlan(
-                    type=PlanType(plan_data['type']),
-                    amount=plan_data['amount'],
-                    installments=plan_data.get('installments'),
-                    first_due_date=plan_data.get('first_due_date'),
-                    frequency=plan_data.get('frequency', 'monthly')
-                )
-            
-            return AssistantResponse(
-                action=ActionType(parsed_json['action']),
-                message_to_user=parsed_json['message_to_user'],
-                structured_plan=structured_plan,
-                confidence=parsed_json.get('confidence', 0.5),
-                escalation=parsed_json.get('escalation', False),
-                compliance_checks=parsed_json.get('compliance_checks', []),
-                metadata={'raw_response': response}
-            )
+            # Validate into the response model in one pass; enum coercion, the
+            # nested plan and its date check all run in pydantic-core. Fill the
+            # defaults the LLM may omit; metadata is ours, never the LLM's. The
+            # raw reply is not kept on the response (it would be persisted with
+            # the message and returned to the client); it is logged at DEBUG.
+            parsed_json.setdefault('confidence', 0.5)
+            parsed_json['structured_plan'] = parsed_json.get('structured_plan') or None
+            parsed_json.pop('metadata', None)
+            return AssistantResponse.model_validate(parsed_json)
             
         except Exception as e:
             logger.error(f"Error parsing LLM response: {e}")
@@ -427,17 +707,16 @@ Respond with the required JSON format followed by your message to the user."""
         
         # Check settlement percentage
         if plan.type == PlanType.SETTLEMENT:
-            max_settlement = float(os.getenv("MAX_SETTLEMENT_PERCENTAGE", "0.70"))
             # Note: We'd need the original balance to calculate percentage
+            # against self.max_settlement_percentage
             # This is a simplified check
             if plan.amount <= 0:
                 errors.append("Settlement amount must be positive")
         
         # Check installment limits
         if plan.type == PlanType.INSTALLMENT:
-            max_months = int(os.getenv("MAX_INSTALLMENT_MONTHS", "12"))
-            if plan.installments and plan.installments > max_months:
-                errors.append(f"Installment plan exceeds maximum {max_months} months")
+            if plan.installments and plan.installments > self.max_installment_months:
+                errors.append(f"Installment plan exceeds maximum {self.max_installment_months} months")
             
             if plan.amount < 25:
                 errors.append("Minimum payment amount is $25")
@@ -452,30 +731,43 @@ Respond with the required JSON format followed by your message to the user."""
         # Check if identity verification is required
         if not conversation_context.get('identity_verified', False):
             if response.action in [ActionType.INFORM, ActionType.COLLECT_PAYMENT, ActionType.PROPOSE_PLAN]:
-                if 'balance' in response.message_to_user.lower() or '$' in response.message_to_user:
+                if _ACCOUNT_DETAIL_RE.search(response.message_to_user):
                     errors.append("Cannot share account details without identity verification")
         
-        # Check for prohibited language
-        prohibited_words = ['threaten', 'sue', 'arrest', 'jail', 'garnish', 'seize']
-        message_lower = response.message_to_user.lower()
-        for word in prohibited_words:
-            if word in message_lower:
+        # Check for prohibited language in one case-insensitive pass
+        found = {word.lower() for word in _PROHIBITED_RE.findall(response.message_to_user)}
+        for word in _PROHIBITED_WORDS:
+            if word in found:
                 errors.append(f"Prohibited language detected: {word}")
         
         return errors
     
-    def _log_llm_interaction(self, conversation_id: str, prompt: str, 
+    @staticmethod
+    def _load_tokenizer():
+        """BPE encoder for token accounting; None if it cannot be loaded"""
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The encoding file is fetched on first use; offline hosts fall
+            # back to the word-count estimate
+            logger.warning(f"tiktoken encoding unavailable, estimating tokens from words: {e}")
+            return None
+    
+    def _count_tokens(self, text: str) -> int:
+        """Token count for usage logging (close to, not exactly, Llama's)"""
+        if self._tokenizer is None:
+            return int(len(text.split()) * 1.3)  # Rough token estimation
+        return len(self._tokenizer.encode_ordinary(text))
+    
+    def _log_llm_interaction(self, conversation_id: str, prompt_tokens: int, 
                            response: str, response_time: float):
         """Log LLM interaction for monitoring and cost tracking"""
         
-        # Estimate token usage (rough approximation)
-        prompt_tokens = len(prompt.split()) * 1.3  # Rough token estimation
-        completion_tokens = len(response.split()) * 1.3
-        
+        logger.debug("Raw LLM response for %s: %s", conversation_id, response)
         log_llm_interaction(
             conversation_id=conversation_id,
-            prompt_tokens=int(prompt_tokens),
-            completion_tokens=int(completion_tokens),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=self._count_tokens(response),
             model="llama-3.1-8b-instant",
             response_time=response_time
         )
@@ -499,9 +791,24 @@ Respond with the required JSON format followed by your message to the user."""
             confidence=1.0,
             escalation=True,
             compliance_checks=["technical_failure_escalation"],
-            metadata={"fallback_reason": "llm_processing_error"}
+            metadata=AssistantMetadata(fallback_reason="llm_processing_error")
         )
 
 
-# Global LLM service instance
-llm_service = LLMService()
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """
+    Shared LLM service instance, created on first use
+    
+    Construction builds the ChatGroq client, embeds the few-shot examples
+    and requires GROQ_API_KEY, so it is deferred until something needs it
+    rather than happening on import.
+    """
+    return LLMService()
+
+
+def __getattr__(name: str):
+    # Backwards-compatible `llm_service` module attribute, resolved lazily
+    if name == "llm_service":
+        return get_llm_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,203 @@
+import os
+import mmap
+import fcntl
+import orjson
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# One fixed-width row per FAISS vector id; -1 marks an unset filter value
+ROW_DTYPE = np.dtype([
+    ('loan_id', '<i8'),
+    ('borrower_id', '<i8'),
+    ('doc_type', '<i4'),
+    ('offset', '<i8'),  # byte offset of the record in the records file
+    ('length', '<i8'),
+])
+
+
+class DocumentMetadataStore:
+    """
+    Append-only columnar store of per-vector document metadata
+
+    Row i describes FAISS vector id i. The filter columns live in a raw
+    fixed-width file that is memory-mapped; each full record (content, title,
+    metadata) is one orjson line in a records file, located through the row's
+    offset and length; the row's embedding is kept in a vectors file, so every
+    process can replay rows appended by another into its own index.
+
+    The files belong to a generation, the number held in the generation file.
+    Appends go to the current generation under an exclusive file lock; a
+    rebuild writes a new generation and swaps it in by renaming the generation
+    file. Files are never truncated or rewritten in place, so a mapped view
+    stays valid, and each process maps only the rows its own index holds.
+    """
+
+    def __init__(self, path: str, dimension: int, generation: int = 0):
+        self.path = path
+        self.dimension = dimension
+        self.generation = generation
+
+        self.columns = np.empty(0, dtype=ROW_DTYPE)
+        self.vectors = np.empty((0, dimension), dtype='<f4')
+        self.doc_type_codes: Dict[str, int] = {}
+        self._records = b""
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def generation_path(self, suffix: str, generation: Optional[int] = None) -> str:
+        """Path of one file (columns, records, vectors, doctypes, index) of a generation"""
+        return f"{self.path}.{self.generation if generation is None else generation}.{suffix}"
+
+    def current_generation(self) -> int:
+        """The published generation (0 until the first rebuild)"""
+        try:
+            with open(f"{self.path}.generation", 'rb') as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def disk_rows(self, generation: Optional[int] = None) -> int:
+        """Complete rows on disk; the columns file is written last, so they are complete"""
+        try:
+            return os.path.getsize(self.generation_path('columns', generation)) // ROW_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def writer(self) -> Iterator[None]:
+        """Exclusive lock, across processes and threads, for appending or publishing"""
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the lock
+
+    def open(self, generation: int, rows: int):
+        """View the first `rows` rows of a generation; nothing is parsed until read"""
+        self.generation = generation
+        self._load_doc_types()
+        self._remap(rows)
+
+    def extend(self) -> int:
+        """Extend the view to every row on disk; returns the first newly visible row"""
+        first_row = len(self.columns)
+        rows = self.disk_rows()
+        if rows > first_row:
+            self._load_doc_types()
+            self._remap(rows)
+        return first_row
+
+    def append(self, records: List[Optional[Dict[str, Any]]], vectors: np.ndarray):
+        """
+        Append one row per record, under writer()
+
+        None appends an empty placeholder row. Rows are written after the last
+        complete row on disk, which need not be in this view yet: extend()
+        picks them up, in order, after rows appended by other processes.
+        """
+        first_row = self.disk_rows()
+        rows = np.full(len(records), -1, dtype=ROW_DTYPE)
+        # Codes may have been added by another process since this view loaded
+        self._load_doc_types()
+        new_doc_types = False
+
+        with open(self.generation_path('records'), 'ab') as f:
+            offset = f.tell()
+            for i, record in enumerate(records):
+                line = orjson.dumps(record or {}, default=str)
+                rows['offset'][i] = offset
+                rows['length'][i] = len(line)
+                f.write(line + b"\n")
+                offset += len(line) + 1
+
+                if not record:
+                    continue
+                if record.get('loan_id') is not None:
+                    rows['loan_id'][i] = record['loan_id']
+                if record.get('borrower_id') is not None:
+                    rows['borrower_id'][i] = record['borrower_id']
+                if record['document_type'] not in self.doc_type_codes:
+                    self.doc_type_codes[record['document_type']] = len(self.doc_type_codes)
+                    new_doc_types = True
+                rows['doc_type'][i] = self.doc_type_codes[record['document_type']]
+
+        if new_doc_types:
+            self._replace_file(self.generation_path('doctypes'), orjson.dumps(list(self.doc_type_codes)))
+        vectors = np.ascontiguousarray(vectors, dtype='<f4')
+        self._write_at(self.generation_path('vectors'), first_row * self.dimension * 4, vectors.tobytes())
+        # Written last: a row exists once its columns do
+        self._write_at(self.generation_path('columns'), first_row * ROW_DTYPE.itemsize, rows.tobytes())
+
+    def get(self, idx: int) -> Optional[Dict[str, Any]]:
+        """The full record for a vector id, or None if there is none"""
+        if not 0 <= idx < len(self.columns):
+            return None
+        row = self.columns[idx]
+        record = orjson.loads(self._records[row['offset']:row['offset'] + row['length']])
+        return record or None
+
+    def new_generation(self) -> "DocumentMetadataStore":
+        """An empty store for the next generation, to fill and then publish(), under writer()"""
+        staged = DocumentMetadataStore(self.path, self.dimension, self.current_generation() + 1)
+        # Leftovers of a rebuild that never published; unlinked, not truncated
+        self._remove_generation(staged.generation)
+        return staged
+
+    def publish(self, staged: "DocumentMetadataStore"):
+        """Make a staged generation the current one, under writer()"""
+        self._replace_file(f"{self.path}.generation", str(staged.generation).encode())
+        # Keep the generation just replaced for processes still switching
+        # over; unlinking leaves any existing mapping of it intact
+        self._remove_generation(staged.generation - 2)
+
+    def _remove_generation(self, generation: int):
+        for suffix in ('columns', 'records', 'vectors', 'doctypes', 'index'):
+            try:
+                os.remove(self.generation_path(suffix, generation))
+            except FileNotFoundError:
+                pass
+
+    def _load_doc_types(self):
+        try:
+            with open(self.generation_path('doctypes'), 'rb') as f:
+                names = orjson.loads(f.read())
+        except FileNotFoundError:
+            names = []
+        self.doc_type_codes = {name: code for code, name in enumerate(names)}
+
+    def _remap(self, rows: int):
+        # Superseded maps are left to be reclaimed once no concurrent reader
+        # still holds them, rather than closed under a running search
+        if rows:
+            self.columns = np.memmap(self.generation_path('columns'), dtype=ROW_DTYPE,
+                                     mode='r', shape=(rows,))
+            self.vectors = np.memmap(self.generation_path('vectors'), dtype='<f4',
+                                     mode='r', shape=(rows, self.dimension))
+            with open(self.generation_path('records'), 'rb') as f:
+                self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.columns = np.empty(0, dtype=ROW_DTYPE)
+            self.vectors = np.empty((0, self.dimension), dtype='<f4')
+            self._records = b""
+
+    @staticmethod
+    def _write_at(path: str, offset: int, data: bytes):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _replace_file(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
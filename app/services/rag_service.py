@@ -1,20 +1,50 @@
 import os
-import json
+import math
+import time
+import atexit
+import threading
 import numpy as np
 import faiss
+import orjson
+import redis
 from typing import List, Dict, Any, Optional, Tuple
-from sentence_transformers import SentenceTransformer
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-import hashlib
+import xxhash
+from functools import lru_cache
 
-from ..models.database import get_db
+from ..models.database import SyncSessionLocal
 from ..models.schemas import VectorDocument, Loan, Borrower
-from ..models.pydantic_models import RAGQuery, RAGResult, RAGResponse
+from ..models.internal_models import RAGResult, RAGResponse
+from .embeddings import (
+    EMBEDDING_WORKERS, EMBEDDING_WORKER_GROUP_SIZE, encode_parallel, encode_texts,
+    load_embedding_model, start_encode_pool
+)
+from .metadata_store import DocumentMetadataStore
 from ..utils.logging_config import get_logger
 
 logger = get_logger(__name__)
 
+# Corpora up to this many vectors use an exact flat scan; past it the index is
+# migrated to an approximate one: an HNSW graph (~log(N) search) or, with
+# RAG_INDEX_TYPE=ivfpq, inverted lists of product-quantized codes
+HNSW_THRESHOLD = int(os.getenv("RAG_HNSW_THRESHOLD", "10000"))
+ANN_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "hnsw").lower()
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 100
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+# Store HNSW vectors as int8 scalar-quantized codes (4x smaller than fp32)
+HNSW_SQ8 = os.getenv("RAG_HNSW_SQ8", "true").lower() == "true"
+# IVFPQ: sqrt(N) lists, 32 sub-quantizers x 8 bits = 32 bytes per vector
+IVFPQ_M = 32
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = int(os.getenv("RAG_IVFPQ_NPROBE", "16"))
+
+# Unsaved index changes are written at most this often (and on shutdown),
+# instead of rewriting the whole FAISS index on every add_document
+INDEX_SAVE_INTERVAL = float(os.getenv("RAG_INDEX_SAVE_INTERVAL", "30"))
+
 
 class RAGService:
     """
@@ -29,11 +59,36 @@ class RAGService:
     
     def __init__(self, embedding_model: str = "all-MiniLM-L6-v2", index_path: str = "data/faiss_index"):
         self.embedding_model_name = embedding_model
-        self.embedding_model = SentenceTransformer(embedding_model)
+        self.embedding_model = load_embedding_model(embedding_model)
         self.embedding_dimension = self.embedding_model.get_sentence_embedding_dimension()
+        # Search queries repeat heavily (fixed policy queries, per-loan borrower
+        # queries), so their embeddings are memoized; independent of the index
+        self._query_embedding = lru_cache(maxsize=1024)(self._embed_query)
         self.index_path = index_path
         self.index = None
-        self.document_metadata = {}
+        # Per-vector metadata and embeddings, shared by every worker process:
+        # memory-mapped filter columns plus full records
+        self.metadata_store = DocumentMetadataStore(index_path, self.embedding_dimension)
+        # Inverted lists of vector ids (ascending) per loan and per borrower
+        self._by_loan: Dict[int, np.ndarray] = {}
+        self._by_borrower: Dict[int, np.ndarray] = {}
+        self._ready = False
+        
+        # Guards the index, the store view and the inverted lists; taken after
+        # the store's writer() lock, never before it
+        self._index_lock = threading.RLock()
+        self._dirty = False
+        self._last_saved = time.monotonic()
+        self._save_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+        
+        # Shared short-TTL cache of per-loan borrower context (profile + document
+        # hits), rebuilt every LLM turn otherwise. Optional: no REDIS_URL, no cache.
+        self.borrower_context_ttl = int(os.getenv("BORROWER_CONTEXT_TTL", "30"))
+        redis_url = os.getenv("REDIS_URL")
+        self.context_cache = redis.Redis.from_url(
+            redis_url, socket_timeout=0.05, socket_connect_timeout=0.05
+        ) if redis_url else None
         
         # Create data directory if it doesn't exist
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
@@ -46,42 +101,252 @@ class RAGService:
     def _load_or_create_index(self):
         """Load existing FAISS index or create a new one"""
         try:
-            if os.path.exists(f"{self.index_path}.index"):
-                self.index = faiss.read_index(f"{self.index_path}.index")
-                
-                # Load metadata
-                if os.path.exists(f"{self.index_path}.metadata"):
-                    with open(f"{self.index_path}.metadata", 'r') as f:
-                        self.document_metadata = json.load(f)
-                
-                logger.info(f"Loaded existing FAISS index with {self.index.ntotal} documents")
-            else:
-                self._create_new_index()
+            with self.metadata_store.writer():
+                self._migrate_legacy_index()
+            
+            with self._index_lock:
+                self._load_generation(self.metadata_store.current_generation())
+                self._catch_up()
+                # A loaded index is usable whether or not the default
+                # documents are (re)added at startup
+                self._ready = self.index.ntotal > 0
+            
+            logger.info(f"Loaded existing FAISS index with {self.index.ntotal} documents")
         except Exception as e:
             logger.error(f"Error loading FAISS index: {e}")
             self._create_new_index()
     
+    def is_ready(self) -> bool:
+        """Cheap readiness check that does not run the embedding model"""
+        if not self._ready and self.index is not None:
+            # Documents added by another worker (e.g. the one whose startup
+            # insert of the default documents won) make this one ready too
+            with self._index_lock:
+                try:
+                    self._catch_up()
+                except Exception as e:
+                    logger.warning(f"Could not load documents added by other processes: {e}")
+                self._ready = self.index.ntotal > 0
+        return self._ready
+    
+    def check_health(self) -> bool:
+        """Run the embedding model and a real search; True if a document comes back"""
+        try:
+            self.encode(["health check"])
+        except Exception as e:
+            logger.error(f"Embedding model health check failed: {e}")
+            return False
+        return bool(self.search("health check", top_k=1).results)
+    
     def _create_new_index(self):
         """Create a new FAISS index"""
-        self.index = faiss.IndexFlatIP(self.embedding_dimension)  # Inner product for cosine similarity
-        self.document_metadata = {}
+        with self._index_lock:
+            self.index = faiss.IndexFlatIP(self.embedding_dimension)  # Inner product for cosine similarity
+            self.metadata_store.open(self.metadata_store.generation, 0)
+            self._by_loan = {}
+            self._by_borrower = {}
         logger.info("Created new FAISS index")
     
+    def _migrate_legacy_index(self):
+        """One-off migration of an index saved with a single JSON metadata file"""
+        legacy_index_path = f"{self.index_path}.index"
+        legacy_path = f"{self.index_path}.metadata"
+        if not (os.path.exists(legacy_index_path) and os.path.exists(legacy_path)):
+            return
+        
+        index = faiss.read_index(legacy_index_path)
+        with open(legacy_path, 'rb') as f:
+            legacy = orjson.loads(f.read())
+        
+        staged = self.metadata_store.new_generation()
+        staged.append([legacy.get(str(i)) for i in range(index.ntotal)],
+                      index.reconstruct_n(0, index.ntotal))
+        self._write_index(index, staged.generation_path('index'))
+        self.metadata_store.publish(staged)
+        os.remove(legacy_path)
+        os.remove(legacy_index_path)
+        logger.info(f"Migrated {len(legacy)} metadata records to the columnar store")
+    
+    def _load_generation(self, generation: int):
+        """Load the saved index of a store generation and view its indexed rows"""
+        index = None
+        index_path = self.metadata_store.generation_path('index', generation)
+        if os.path.exists(index_path):
+            index = faiss.read_index(index_path)
+            if index.ntotal > self.metadata_store.disk_rows(generation):
+                logger.warning(f"Saved index has {index.ntotal} vectors for fewer stored rows; replaying the store")
+                index = None
+        if index is None:
+            index = faiss.IndexFlatIP(self.embedding_dimension)
+        elif isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = IVFPQ_NPROBE
+        
+        self.index = index
+        self.metadata_store.open(generation, index.ntotal)
+        self._by_loan = {}
+        self._by_borrower = {}
+        self._extend_inverted_lists(0)
+    
+    def _catch_up(self) -> bool:
+        """
+        Add rows appended to the store since this process last looked
+        
+        Covers rows from other worker processes, this process's own appends,
+        and a generation published by a rebuild elsewhere. Call with
+        _index_lock held. Returns whether the index changed.
+        """
+        generation = self.metadata_store.current_generation()
+        switched = generation != self.metadata_store.generation
+        if switched:
+            self._load_generation(generation)
+        
+        first_id = self.metadata_store.extend()
+        if first_id == len(self.metadata_store):
+            return switched
+        
+        self.index.add(np.ascontiguousarray(self.metadata_store.vectors[first_id:]))
+        self._extend_inverted_lists(first_id)
+        self.index = self._maybe_upgrade_index(self.index, self.metadata_store)
+        return True
+    
+    def _extend_inverted_lists(self, first_id: int):
+        """Add vector ids first_id.. of the metadata store to the inverted lists"""
+        columns = self.metadata_store.columns[first_id:]
+        for by_key, values in ((self._by_loan, columns['loan_id']),
+                               (self._by_borrower, columns['borrower_id'])):
+            order = np.argsort(values, kind='stable')
+            keys, starts = np.unique(values[order], return_index=True)
+            for key, ids in zip(keys.tolist(), np.split(order + first_id, starts[1:])):
+                if key < 0:
+                    continue
+                existing = by_key.get(key)
+                by_key[key] = ids if existing is None else np.concatenate([existing, ids])
+    
+    def _maybe_upgrade_index(self, index, store: DocumentMetadataStore):
+        """The index, migrated to an ANN index if it is a flat one that has outgrown HNSW_THRESHOLD"""
+        if not isinstance(index, faiss.IndexFlat) or index.ntotal < HNSW_THRESHOLD:
+            return index
+        
+        # Vector ids (and so the metadata keys) are preserved: the stored
+        # vectors are re-added in their original order
+        vectors = np.ascontiguousarray(store.vectors[:index.ntotal])
+        if ANN_INDEX_TYPE == "ivfpq":
+            index = self._build_ivfpq_index(vectors)
+            logger.info(f"Migrated FAISS index to IVFPQ at {index.ntotal} documents")
+            return index
+        
+        if HNSW_SQ8:
+            # The quantizer learns per-dimension ranges from the existing corpus
+            index = faiss.IndexHNSWSQ(
+                self.embedding_dimension, faiss.ScalarQuantizer.QT_8bit,
+                HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(vectors)
+        else:
+            index = faiss.IndexHNSWFlat(self.embedding_dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        index.add(vectors)
+        logger.info(f"Migrated FAISS index to HNSW at {index.ntotal} documents")
+        return index
+    
+    def _build_ivfpq_index(self, vectors: np.ndarray):
+        """Train an IVFPQ index on (a sample of) vectors and add them all"""
+        nlist = max(int(math.sqrt(len(vectors))), 1)
+        quantizer = faiss.IndexFlatIP(self.embedding_dimension)
+        index = faiss.IndexIVFPQ(
+            quantizer, self.embedding_dimension, nlist, IVFPQ_M, IVFPQ_NBITS,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        
+        train_size = min(max(40 * nlist, 10000), len(vectors))
+        sample = np.random.default_rng(0).choice(len(vectors), train_size, replace=False)
+        index.train(vectors[np.sort(sample)])
+        index.nprobe = IVFPQ_NPROBE
+        index.add(vectors)
+        return index
+    
     def _save_index(self):
-        """Save FAISS index and metadata to disk"""
+        """Save FAISS index to disk; the metadata store is appended to as it grows"""
         try:
-            faiss.write_index(self.index, f"{self.index_path}.index")
-            
-            with open(f"{self.index_path}.metadata", 'w') as f:
-                json.dump(self.document_metadata, f, indent=2, default=str)
+            with self._index_lock:
+                # A process still on a superseded generation has nothing worth saving
+                if self.metadata_store.generation == self.metadata_store.current_generation():
+                    self._write_index(self.index, self.metadata_store.generation_path('index'))
+                self._dirty = False
+                self._last_saved = time.monotonic()
             
             logger.info(f"Saved FAISS index with {self.index.ntotal} documents")
         except Exception as e:
             logger.error(f"Error saving FAISS index: {e}")
     
+    @staticmethod
+    def _write_index(index, path: str):
+        # Written aside and renamed, so a loading process never reads a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+    
+    def _filter_candidates(self, loan_id: Optional[int], borrower_id: Optional[int],
+                           document_types: Optional[List[str]]) -> Optional[np.ndarray]:
+        """Vector ids matching the filters, or None when no filter is given"""
+        candidates = None
+        if loan_id:
+            candidates = self._by_loan.get(loan_id, np.empty(0, dtype=np.int64))
+        if borrower_id:
+            ids = self._by_borrower.get(borrower_id, np.empty(0, dtype=np.int64))
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+        if document_types:
+            doc_type_codes = self.metadata_store.doc_type_codes
+            codes = [doc_type_codes[t] for t in document_types if t in doc_type_codes]
+            doc_types = self.metadata_store.columns['doc_type']
+            if candidates is None:
+                candidates = np.flatnonzero(np.isin(doc_types, codes)).astype(np.int64)
+            else:
+                candidates = candidates[np.isin(doc_types[candidates], codes)]
+        return candidates
+    
+    def _search_params(self, candidates: np.ndarray):
+        """FAISS search parameters restricting the search to candidate ids"""
+        selector = faiss.IDSelectorBatch(len(candidates), faiss.swig_ptr(candidates))
+        if isinstance(self.index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH)
+        if isinstance(self.index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=IVFPQ_NPROBE)
+        return faiss.SearchParameters(sel=selector)
+    
+    def _mark_dirty(self):
+        """Record unsaved index changes and make sure a save is due"""
+        self._dirty = True
+        if time.monotonic() - self._last_saved >= INDEX_SAVE_INTERVAL:
+            self._save_index()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(INDEX_SAVE_INTERVAL, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush(self):
+        """Save the FAISS index if it has unsaved changes"""
+        with self._index_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._dirty:
+                self._save_index()
+    
+    def _embed_query(self, query: str) -> np.ndarray:
+        # The returned array is shared through the cache; callers must not modify it
+        return self.encode([query])
+    
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Embed texts in batches as unit-length float32 vectors"""
+        return encode_texts(self.embedding_model, texts, batch_size=batch_size)
+    
     def _generate_document_id(self, content: str, document_type: str, source: str) -> str:
         """Generate unique document ID based on content hash"""
-        content_hash = hashlib.md5(content.encode()).hexdigest()
+        content_hash = xxhash.xxh3_64_hexdigest(content)
         return f"{document_type}_{source}_{content_hash[:8]}"
     
     def add_document(self, content: str, document_type: str, source: str, 
@@ -105,79 +370,125 @@ class RAGService:
         Returns:
             List of document IDs created
         """
+        return self.add_documents(
+            [{
+                'content': content,
+                'document_type': document_type,
+                'source': source,
+                'title': title,
+                'metadata': metadata,
+                'loan_id': loan_id,
+                'borrower_id': borrower_id
+            }],
+            chunk_size=chunk_size,
+            overlap=overlap
+        )
+    
+    def add_documents(self, documents: List[Dict[str, Any]],
+                      chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """
+        Add several documents with one batched encode, one INSERT and one index update
+        
+        Args:
+            documents: Dicts with the add_document arguments (content,
+                document_type and source required; title, metadata, loan_id
+                and borrower_id optional)
+            chunk_size: Size of text chunks
+            overlap: Overlap between chunks
+        
+        Returns:
+            List of document IDs created, across all documents
+        """
+        db = SyncSessionLocal()
         try:
-            # Split content into chunks
-            chunks = self._chunk_text(content, chunk_size, overlap)
-            document_ids = []
+            created_at = datetime.utcnow().isoformat()
+            records = []
+            rows = []
+            for document in documents:
+                source = document['source']
+                title = document.get('title')
+                metadata = document.get('metadata')
+                
+                # Split content into chunks
+                chunks = self._chunk_text(document['content'], chunk_size, overlap)
+                for i, chunk in enumerate(chunks):
+                    # Generate document ID
+                    doc_id = self._generate_document_id(chunk, document['document_type'], f"{source}_chunk_{i}")
+                    
+                    # Store metadata
+                    doc_metadata = {
+                        'document_id': doc_id,
+                        'document_type': document['document_type'],
+                        'source': source,
+                        'title': title or f"{source} - Chunk {i+1}",
+                        'content': chunk,
+                        'chunk_index': i,
+                        'loan_id': document.get('loan_id'),
+                        'borrower_id': document.get('borrower_id'),
+                        'metadata': metadata or {},
+                        'created_at': created_at
+                    }
+                    records.append(doc_metadata)
+                    rows.append({
+                        'document_id': doc_id,
+                        'document_type': document['document_type'],
+                        'source': source,
+                        'title': doc_metadata['title'],
+                        'content': chunk,
+                        'chunk_index': i,
+                        'document_metadata': metadata,
+                        'loan_id': document.get('loan_id'),
+                        'borrower_id': document.get('borrower_id'),
+                        'embedding_model': self.embedding_model_name
+                    })
             
-            db = next(get_db())
+            if not records:
+                return []
             
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding = self.embedding_model.encode([chunk])
-                embedding = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)  # Normalize for cosine similarity
-                
-                # Generate document ID
-                doc_id = self._generate_document_id(chunk, document_type, f"{source}_chunk_{i}")
-                
-                # Add to FAISS index
-                self.index.add(embedding.astype('float32'))
-                
-                # Store metadata
-                doc_metadata = {
-                    'document_id': doc_id,
-                    'document_type': document_type,
-                    'source': source,
-                    'title': title or f"{source} - Chunk {i+1}",
-                    'content': chunk,
-                    'chunk_index': i,
-                    'loan_id': loan_id,
-                    'borrower_id': borrower_id,
-                    'metadata': metadata or {},
-                    'created_at': datetime.utcnow().isoformat()
-                }
-                
-                self.document_metadata[str(self.index.ntotal - 1)] = doc_metadata
-                
-                # Store in database
-                vector_doc = VectorDocument(
-                    document_id=doc_id,
-                    document_type=document_type,
-                    source=source,
-                    title=doc_metadata['title'],
-                    content=chunk,
-                    chunk_index=i,
-                    metadata=metadata,
-                    loan_id=loan_id,
-                    borrower_id=borrower_id,
-                    embedding_model=self.embedding_model_name
-                )
-                
-                db.add(vector_doc)
-                document_ids.append(doc_id)
+            # Embed every chunk of every document in one batched, normalized (cosine) encode
+            embeddings = self.encode([record['content'] for record in records])
             
-            db.commit()
-            self._save_index()
+            # The database rows and the store rows are written in the same
+            # order by every process, and not while a rebuild is running
+            with self.metadata_store.writer():
+                # Store in database: one executemany INSERT for all chunks
+                db.execute(insert(VectorDocument), rows)
+                db.commit()
+                
+                with self._index_lock:
+                    self.metadata_store.append(records, embeddings)
+                    # Indexes rows other processes appended first, then these
+                    self._catch_up()
+                    self._mark_dirty()
             
-            logger.info(f"Added document with {len(chunks)} chunks to vector database")
-            return document_ids
+            logger.info(f"Added {len(documents)} documents with {len(records)} chunks to vector database")
+            return [record['document_id'] for record in records]
             
         except Exception as e:
-            logger.error(f"Error adding document to vector database: {e}")
+            logger.error(f"Error adding documents to vector database: {e}")
             db.rollback()
             raise
         finally:
             db.close()
     
-    def _chunk_text(self, text: str, chunk_size: int, overlap: int) -> List[str]:
+    @staticmethod
+    def _chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
         """Split text into overlapping chunks"""
         words = text.split()
-        chunks = []
+        if not words:
+            return []
         
+        # Chunks are slices of the whitespace-normalized text, located by
+        # precomputed word offsets, rather than re-joined word lists
+        normalized = ' '.join(words)
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        ends = np.cumsum(lengths + 1) - 1
+        starts = ends - lengths
+        
+        chunks = []
         for i in range(0, len(words), chunk_size - overlap):
-            chunk_words = words[i:i + chunk_size]
-            chunk = ' '.join(chunk_words)
-            chunks.append(chunk)
+            last = min(i + chunk_size, len(words)) - 1
+            chunks.append(normalized[starts[i]:ends[last]])
             
             if i + chunk_size >= len(words):
                 break
@@ -203,45 +514,42 @@ class RAGService:
         
         try:
             # Generate query embedding
-            query_embedding = self.embedding_model.encode([query])
-            query_embedding = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
+            query_embedding = self._query_embedding(query)
             
-            # Search in FAISS index
-            scores, indices = self.index.search(query_embedding.astype('float32'), min(top_k * 3, self.index.ntotal))
-            
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1:  # FAISS returns -1 for invalid indices
-                    continue
+            with self._index_lock:
+                try:
+                    self._catch_up()
+                except Exception as e:
+                    # Search what this process already has
+                    logger.warning(f"Could not load documents added by other processes: {e}")
                 
-                doc_metadata = self.document_metadata.get(str(idx))
-                if not doc_metadata:
-                    continue
-                
-                # Apply filters
-                if loan_id and doc_metadata.get('loan_id') != loan_id:
-                    continue
+                # Filters are applied inside FAISS, so the search returns the true
+                # top_k among matching vectors without overfetching
+                candidates = self._filter_candidates(loan_id, borrower_id, document_types)
+                if candidates is None:
+                    scores, indices = self.index.search(query_embedding, min(top_k, self.index.ntotal))
+                elif len(candidates):
+                    scores, indices = self.index.search(
+                        query_embedding, min(top_k, len(candidates)),
+                        params=self._search_params(candidates)
+                    )
+                else:
+                    scores = indices = np.empty((1, 0))
                 
-                if borrower_id and doc_metadata.get('borrower_id') != borrower_id:
-                    continue
-                
-                if document_types and doc_metadata.get('document_type') not in document_types:
-                    continue
-                
-                result = RAGResult(
-                    document_id=doc_metadata['document_id'],
-                    content=doc_metadata['content'],
-                    score=float(score),
-                    metadata=doc_metadata.get('metadata', {}),
-                    document_type=doc_metadata['document_type']
-                )
-                results.append(result)
-                
-                if len(results) >= top_k:
-                    break
-            
-            # Sort by score (descending)
-            results.sort(key=lambda x: x.score, reverse=True)
+                # Hits come back in score order; FAISS pads missing hits with -1
+                results = []
+                for score, idx in zip(scores[0], indices[0]):
+                    doc_metadata = self.metadata_store.get(int(idx))
+                    if not doc_metadata:
+                        continue
+                    
+                    results.append(RAGResult(
+                        document_id=doc_metadata['document_id'],
+                        content=doc_metadata['content'],
+                        score=float(score),
+                        metadata=doc_metadata.get('metadata', {}),
+                        document_type=doc_metadata['document_type']
+                    ))
             
             query_time = (datetime.utcnow() - start_time).total_seconds()
             
@@ -264,15 +572,24 @@ class RAGService:
         Returns:
             Dictionary with borrower profile, loan details, and payment history
         """
+        cache_key = f"borrower_context:{loan_id}:{borrower_id}"
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        db = SyncSessionLocal()
         try:
-            db = next(get_db())
-            
-            # Get loan and borrower information
-            loan = db.query(Loan).filter(Loan.id == loan_id).first()
-            borrower = db.query(Borrower).filter(Borrower.id == borrower_id).first()
+            # Get loan and borrower information in one round-trip
+            row = (
+                db.query(Loan, Borrower)
+                .join(Borrower, Borrower.id == Loan.borrower_id)
+                .filter(Loan.id == loan_id, Borrower.id == borrower_id)
+                .first()
+            )
             
-            if not loan or not borrower:
+            if not row:
                 return {}
+            loan, borrower = row
             
             # Search for borrower-specific documents
             borrower_docs = self.search(
@@ -307,6 +624,7 @@ class RAGService:
                 ]
             }
             
+            self._cache_set(cache_key, context)
             return context
             
         except Exception as e:
@@ -315,6 +633,33 @@ class RAGService:
         finally:
             db.close()
     
+    def invalidate_borrower_context(self, loan_id: int, borrower_id: int):
+        """Drop the cached borrower context after the loan changes"""
+        if self.context_cache is None:
+            return
+        try:
+            self.context_cache.delete(f"borrower_context:{loan_id}:{borrower_id}")
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate borrower context cache: {e}")
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.context_cache is None:
+            return None
+        try:
+            raw = self.context_cache.get(key)
+        except redis.RedisError as e:
+            logger.debug(f"Borrower context cache unavailable: {e}")
+            return None
+        return orjson.loads(raw) if raw else None
+    
+    def _cache_set(self, key: str, value: Dict[str, Any]):
+        if self.context_cache is None:
+            return
+        try:
+            self.context_cache.set(key, orjson.dumps(value), ex=self.borrower_context_ttl)
+        except redis.RedisError as e:
+            logger.debug(f"Borrower context cache unavailable: {e}")
+    
     def get_policy_context(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
         Get relevant policy and regulation information
@@ -414,70 +759,108 @@ class RAGService:
         
         logger.info("Initializing vector database with default documents...")
         
-        for policy in compliance_policies:
-            self.add_document(
-                content=policy['content'],
-                document_type=policy['document_type'],
-                source=policy['source'],
-                title=policy['title']
-            )
+        self.add_documents(compliance_policies)
         
+        self._ready = True
         logger.info("Default documents added to vector database")
     
     def rebuild_index(self):
         """Rebuild the entire FAISS index from database"""
+        pool = None
+        db = SyncSessionLocal()
         try:
             logger.info("Rebuilding FAISS index from database...")
             
-            # Create new index
-            self._create_new_index()
-            
-            db = next(get_db())
-            documents = db.query(VectorDocument).all()
-            
-            embeddings = []
-            metadata_list = []
-            
-            for doc in documents:
-                # Generate embedding
-                embedding = self.embedding_model.encode([doc.content])
-                embedding = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
-                embeddings.append(embedding[0])
+            # The new index and store generation are built aside; searches keep
+            # using the current ones until the swap, and appends wait for it
+            with self.metadata_store.writer():
+                staged = self.metadata_store.new_generation()
+                index = faiss.IndexFlatIP(self.embedding_dimension)
                 
-                # Prepare metadata
-                doc_metadata = {
-                    'document_id': doc.document_id,
-                    'document_type': doc.document_type,
-                    'source': doc.source,
-                    'title': doc.title,
-                    'content': doc.content,
-                    'chunk_index': doc.chunk_index,
-                    'loan_id': doc.loan_id,
-                    'borrower_id': doc.borrower_id,
-                    'metadata': doc.metadata or {},
-                    'created_at': doc.created_at.isoformat()
-                }
-                metadata_list.append(doc_metadata)
-            
-            if embeddings:
-                # Add all embeddings to index
-                embeddings_array = np.array(embeddings).astype('float32')
-                self.index.add(embeddings_array)
+                total = db.query(func.count(VectorDocument.id)).scalar()
                 
-                # Update metadata
-                for i, metadata in enumerate(metadata_list):
-                    self.document_metadata[str(i)] = metadata
+                # Large corpora on multi-core CPU hosts are encoded by a pool of
+                # worker processes, one group of texts per worker per page
+                page_size = EMBEDDING_WORKER_GROUP_SIZE
+                if (self.embedding_model.device.type == "cpu" and EMBEDDING_WORKERS > 1
+                        and total > EMBEDDING_WORKER_GROUP_SIZE):
+                    pool = start_encode_pool(self.embedding_model_name)
+                    page_size *= EMBEDDING_WORKERS
                 
-                self._save_index()
+                # Stream the documents a page at a time so memory stays bounded
+                # by the page size rather than the corpus size
+                documents = db.execute(
+                    select(VectorDocument)
+                    .order_by(VectorDocument.id)
+                    .execution_options(yield_per=page_size)
+                ).scalars()
+                
+                for page in documents.partitions():
+                    texts = [doc.content for doc in page]
+                    # Batched encode of the page, already normalized
+                    embeddings = (
+                        encode_parallel(pool, texts) if pool is not None
+                        else self.encode(texts, batch_size=128)
+                    )
+                    
+                    index.add(embeddings)
+                    staged.append([
+                        {
+                            'document_id': doc.document_id,
+                            'document_type': doc.document_type,
+                            'source': doc.source,
+                            'title': doc.title,
+                            'content': doc.content,
+                            'chunk_index': doc.chunk_index,
+                            'loan_id': doc.loan_id,
+                            'borrower_id': doc.borrower_id,
+                            'metadata': doc.document_metadata or {},
+                            'created_at': doc.created_at.isoformat()
+                        }
+                        for doc in page
+                    ], embeddings)
+                    # The page's ORM objects are not needed past this point
+                    db.expunge_all()
+                
+                staged.extend()
+                index = self._maybe_upgrade_index(index, staged)
+                self._write_index(index, staged.generation_path('index'))
+                self.metadata_store.publish(staged)
+                
+                with self._index_lock:
+                    self.index = index
+                    self.metadata_store = staged
+                    self._by_loan = {}
+                    self._by_borrower = {}
+                    self._extend_inverted_lists(0)
+                    self._dirty = False
+                    self._last_saved = time.monotonic()
             
-            logger.info(f"Index rebuilt with {len(embeddings)} documents")
+            self._ready = True
+            logger.info(f"Index rebuilt with {index.ntotal} documents")
             
         except Exception as e:
             logger.error(f"Error rebuilding index: {e}")
             raise
         finally:
+            if pool is not None:
+                pool.shutdown()
             db.close()
 
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    """
+    Shared RAG service instance, created on first use
+    
+    Construction loads the embedding model and opens or builds the FAISS
+    index, so it is deferred until something needs it rather than
+    happening on import.
+    """
+    return RAGService()
+
 
-# Global RAG service instance
-rag_service = RAGService()
+def __getattr__(name: str):
+    # Backwards-compatible `rag_service` module attribute, resolved lazily
+    if name == "rag_service":
+        return get_rag_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Callable, Optional
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Audit/conversation logging events, run after the response by one drain task.
+# The handlers are synchronous logging calls that format a record and hand it
+# to a QueueHandler (file I/O happens on the log listener threads), so they
+# run one after another on the event loop; more tasks would add no overlap.
+EVENT_QUEUE_SIZE = 10000
+EVENT_BATCH_SIZE = 128
+
+_event_queue: Optional[asyncio.Queue] = None
+_event_worker: Optional[asyncio.Task] = None
+
+
+def _run_event(handler: Callable, args: tuple) -> None:
+    # An event failing to log must not fail the request that raised it
+    try:
+        handler(*args)
+    except Exception as e:
+        logger.error(f"Error processing background event: {e}")
+
+
+async def _drain_events(event_queue: asyncio.Queue):
+    """Run queued logging events in batches"""
+    while True:
+        batch = [await event_queue.get()]
+        while not event_queue.empty() and len(batch) < EVENT_BATCH_SIZE:
+            batch.append(event_queue.get_nowait())
+
+        for handler, args in batch:
+            _run_event(handler, args)
+
+        for _ in batch:
+            event_queue.task_done()
+
+
+def start_event_workers() -> None:
+    """Create the event queue and the task that drains it"""
+    global _event_queue, _event_worker
+    _event_queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    _event_worker = asyncio.create_task(_drain_events(_event_queue))
+
+
+async def stop_event_workers(timeout: float = 5) -> None:
+    """Flush pending events (bounded by timeout) and stop the drain task"""
+    global _event_queue, _event_worker
+    if _event_queue is None:
+        return
+
+    try:
+        await asyncio.wait_for(_event_queue.join(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Timed out flushing background events on shutdown")
+    _event_worker.cancel()
+    _event_worker = None
+    _event_queue = None
+
+
+def enqueue_event(handler: Callable, *args) -> None:
+    """Hand an event to the drain task, or run it inline if there is none or the queue is full"""
+    if _event_queue is None:
+        # No drain task outside the API process (scripts, tests); run inline
+        _run_event(handler, args)
+        return
+
+    try:
+        _event_queue.put_nowait((handler, args))
+    except asyncio.QueueFull:
+        # Payment, escalation and compliance records are never dropped; under
+        # backlog the event is logged on the request path instead
+        _run_event(handler, args)
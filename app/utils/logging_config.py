@@ -1,8 +1,10 @@
 import logging
 import logging.handlers
 import os
+import queue
+import re
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict
 
@@ -11,49 +13,113 @@ import colorlog
 from structlog.stdlib import LoggerFactory
 
 
+# Listeners that perform the actual handler I/O off the request path
+_queue_listeners = []
+_listeners_running = False
+
+# PII masking patterns and fields, compiled once rather than per log record.
+# One alternation scans each message once; email comes first so an address
+# whose local part looks like an SSN or phone number is masked whole.
+_PII_RE = re.compile(
+    r'(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b)'
+    r'|(?P<ssn>\b\d{3}-\d{2}-\d{4}\b)'
+    r'|(?P<phone>\b\d{3}-\d{3}-\d{4}\b)'
+)
+_PII_REPLACEMENTS = {'email': 'XXX@XXX.com', 'ssn': 'XXX-XX-XXXX', 'phone': 'XXX-XXX-XXXX'}
+_SENSITIVE_FIELDS = frozenset({
+    'ssn', 'social_security', 'credit_card', 'account_number',
+    'phone', 'email', 'address', 'full_name'
+})
+# Prebuilt runs of mask characters for common field lengths
+_MASKS = tuple('*' * i for i in range(64))
+
+
+def _mask_value(value: str) -> str:
+    length = len(value)
+    if length <= 4:
+        return _MASKS[length]
+    mask = _MASKS[length - 4] if length - 4 < len(_MASKS) else '*' * (length - 4)
+    return value[:2] + mask + value[-2:]
+
+
 class ComplianceFilter(logging.Filter):
     """Filter to ensure compliance-sensitive logs are properly handled"""
     
+    def __init__(self, name: str = ""):
+        super().__init__(name)
+        self.service = "debt-recovery-agent"
+    
     def filter(self, record):
-        # Add compliance metadata to all records
-        record.compliance_timestamp = datetime.utcnow().isoformat()
-        record.service = "debt-recovery-agent"
+        # Add compliance metadata to all records; the timestamp reuses the
+        # creation time logging already captured instead of reading the clock
+        record.compliance_timestamp = datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat()
+        record.service = self.service
         return True
 
 
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that coalesces pending records into a single write"""
+    
+    def __init__(self, *args, batch_size: int = 256, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self._pending = []
+    
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.flush()
+                self.doRollover()
+            self._pending.append(self.format(record) + self.terminator)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+    
+    def flush(self):
+        self.acquire()
+        try:
+            if self._pending:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(''.join(self._pending))
+                self._pending.clear()
+            super().flush()
+        finally:
+            self.release()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """QueueListener that flushes its handlers whenever the queue drains"""
+    
+    def dequeue(self, block):
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
+    
+    def stop(self):
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
 class PIIMaskingProcessor:
     """Processor to mask PII in log messages"""
     
     @staticmethod
     def mask_pii(event_dict: Dict[str, Any]) -> Dict[str, Any]:
         """Mask sensitive information in log events"""
-        sensitive_fields = [
-            'ssn', 'social_security', 'credit_card', 'account_number',
-            'phone', 'email', 'address', 'full_name'
-        ]
-        
-        def mask_value(value: str) -> str:
-            if len(value) <= 4:
-                return '*' * len(value)
-            return value[:2] + '*' * (len(value) - 4) + value[-2:]
-        
         # Mask sensitive fields in the event dictionary
-        for field in sensitive_fields:
-            if field in event_dict:
-                if isinstance(event_dict[field], str):
-                    event_dict[field] = mask_value(event_dict[field])
+        for field in _SENSITIVE_FIELDS & event_dict.keys():
+            if isinstance(event_dict[field], str):
+                event_dict[field] = _mask_value(event_dict[field])
         
         # Mask sensitive patterns in message text
         message = event_dict.get('event', '')
         if isinstance(message, str):
-            # Simple regex patterns for common PII
-            import re
-            # Mask SSN patterns (XXX-XX-XXXX)
-            message = re.sub(r'\b\d{3}-\d{2}-\d{4}\b', 'XXX-XX-XXXX', message)
-            # Mask phone patterns
-            message = re.sub(r'\b\d{3}-\d{3}-\d{4}\b', 'XXX-XXX-XXXX', message)
-            # Mask email patterns
-            message = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', 'XXX@XXX.com', message)
+            # Mask SSN (XXX-XX-XXXX), phone and email patterns
+            message = _PII_RE.sub(lambda match: _PII_REPLACEMENTS[match.lastgroup], message)
             event_dict['event'] = message
         
         return event_dict
@@ -69,6 +135,8 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
     - Structured logging with JSON format
     - PII masking for compliance
     - Audit trail capabilities
+    - Non-blocking emission: loggers only enqueue records, handler I/O runs
+      on QueueListener threads started by start_log_listeners()
     """
     
     # Create logs directory if it doesn't exist
@@ -101,6 +169,8 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
     
     # Clear existing handlers
     root_logger.handlers.clear()
+    stop_log_listeners()
+    _queue_listeners.clear()
     
     # Console handler with colors
     console_handler = colorlog.StreamHandler(sys.stdout)
@@ -116,7 +186,6 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
         }
     )
     console_handler.setFormatter(console_formatter)
-    console_handler.addFilter(ComplianceFilter())
     
     # File handler with rotation (for general logs)
     file_handler = logging.handlers.RotatingFileHandler(
@@ -130,11 +199,10 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     file_handler.setFormatter(file_formatter)
-    file_handler.addFilter(ComplianceFilter())
     
     # Audit log handler (separate file for compliance)
     audit_log_path = log_dir / "audit.log"
-    audit_handler = logging.handlers.RotatingFileHandler(
+    audit_handler = BatchedRotatingFileHandler(
         audit_log_path,
         maxBytes=50 * 1024 * 1024,  # 50MB
         backupCount=50,  # Keep more audit logs
@@ -145,21 +213,20 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     audit_handler.setFormatter(audit_formatter)
-    audit_handler.addFilter(ComplianceFilter())
     
     # Add handlers to root logger
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+    root_logger.addHandler(_queue_handler(console_handler, file_handler, compliance=True))
     
     # Create audit logger
     audit_logger = logging.getLogger('audit')
-    audit_logger.addHandler(audit_handler)
+    audit_logger.handlers.clear()
+    audit_logger.addHandler(_queue_handler(audit_handler, compliance=True))
     audit_logger.setLevel(logging.INFO)
     audit_logger.propagate = False  # Don't propagate to root logger
     
     # Create conversation logger (for chat transcripts)
     conversation_log_path = log_dir / "conversations.log"
-    conversation_handler = logging.handlers.RotatingFileHandler(
+    conversation_handler = BatchedRotatingFileHandler(
         conversation_log_path,
         maxBytes=100 * 1024 * 1024,  # 100MB
         backupCount=20,
@@ -172,11 +239,46 @@ def setup_logging(log_level: str = "INFO", log_file_path: str = "logs/debt_recov
     conversation_handler.setFormatter(conversation_formatter)
     
     conversation_logger = logging.getLogger('conversation')
-    conversation_logger.addHandler(conversation_handler)
+    conversation_logger.handlers.clear()
+    conversation_logger.addHandler(_queue_handler(conversation_handler))
     conversation_logger.setLevel(logging.INFO)
     conversation_logger.propagate = False
 
 
+def _queue_handler(*handlers: logging.Handler, compliance: bool = False) -> logging.handlers.QueueHandler:
+    """Wrap handlers behind a QueueHandler and register the listener that drains it"""
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if compliance:
+        # Stamp compliance metadata at emit time, not when the listener writes
+        queue_handler.addFilter(ComplianceFilter())
+    
+    _queue_listeners.append(
+        BatchingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    )
+    return queue_handler
+
+
+def start_log_listeners() -> None:
+    """Start the background threads that write queued log records"""
+    global _listeners_running
+    if _listeners_running:
+        return
+    for listener in _queue_listeners:
+        listener.start()
+    _listeners_running = True
+
+
+def stop_log_listeners() -> None:
+    """Flush queued log records and stop the listener threads"""
+    global _listeners_running
+    if not _listeners_running:
+        return
+    for listener in _queue_listeners:
+        listener.stop()
+    _listeners_running = False
+
+
 def get_logger(name: str) -> structlog.stdlib.BoundLogger:
     """Get a structured logger instance"""
     return structlog.get_logger(name)
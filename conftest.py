@@ -0,0 +1,44 @@
+"""
+Shared fixtures for the system tests
+
+The system tests run against a live server (python run.py); one HTTP client
+and one readiness check are shared by the whole session. Without a server
+they are skipped and the offline unit tests still run.
+"""
+
+import asyncio
+import socket
+
+import httpx
+import pytest
+import pytest_asyncio
+
+SERVER_ADDRESS = ("localhost", 8000)
+BASE_URL = "http://%s:%d" % SERVER_ADDRESS
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """One event loop for the session, so the shared client outlives each test"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def server_ready():
+    """Skip the tests that need the server if nothing is listening on its port"""
+    # A bare TCP connect, no HTTP round-trip; the first real request
+    # doubles as the readiness check. Checked once: the skip is cached with
+    # the fixture, and offline tests that do not use it still run.
+    try:
+        socket.create_connection(SERVER_ADDRESS, timeout=2).close()
+    except OSError:
+        pytest.skip("Server is not running! Please start the server with: python run.py")
+
+
+@pytest_asyncio.fixture(scope="session")
+async def client(server_ready):
+    """HTTP client whose connection pool is reused by every test"""
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=30) as client:
+        yield client
@@ -0,0 +1,51 @@
+"""Borrower contact times, backfilled from conversations
+
+Adds borrowers.last_contact_at and borrowers.recent_contact_times, which
+the contact-frequency check reads (CONTACT_FREQUENCY_SOURCE=counters), and
+fills them from each borrower's existing conversations so the daily and
+weekly limits apply to history recorded before the columns existed.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# ComplianceService._recent_contacts_kept: max(daily, weekly) contact limits
+RECENT_CONTACTS_KEPT = 7
+
+
+def upgrade() -> None:
+    # A database created by create_all after this change already has the
+    # columns; one with no tables yet gets them from create_all
+    if not context.is_offline_mode() and not sa.inspect(op.get_bind()).has_table("borrowers"):
+        return
+
+    op.execute("ALTER TABLE borrowers ADD COLUMN IF NOT EXISTS last_contact_at TIMESTAMP WITHOUT TIME ZONE")
+    op.execute("ALTER TABLE borrowers ADD COLUMN IF NOT EXISTS recent_contact_times TIMESTAMP WITHOUT TIME ZONE[]")
+
+    # Newest conversation start times first, as record_contact keeps them
+    op.execute(f"""
+        UPDATE borrowers SET
+            recent_contact_times = recent.times,
+            last_contact_at = recent.times[1]
+        FROM (
+            SELECT borrower_id,
+                   (array_agg(created_at ORDER BY created_at DESC))[1:{RECENT_CONTACTS_KEPT}] AS times
+            FROM conversations
+            GROUP BY borrower_id
+        ) AS recent
+        WHERE borrowers.id = recent.borrower_id
+          AND borrowers.recent_contact_times IS NULL
+    """)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE borrowers DROP COLUMN IF EXISTS recent_contact_times")
+    op.execute("ALTER TABLE borrowers DROP COLUMN IF EXISTS last_contact_at")
@@ -32,18 +32,40 @@ def main():
     print(f"📊 Health Check: http://{host}:{port}/health")
     print(f"📚 API Docs: http://{host}:{port}/docs")
     print(f"🔧 Reload: {reload}")
+    if not reload:
+        print(f"👷 Workers: {os.getenv('WEB_CONCURRENCY', '4')}")
     print(f"📝 Log Level: {log_level}")
     print("=" * 60)
     
     # Start the server
-    uvicorn.run(
-        "app.main:app",
-        host=host,
-        port=port,
-        reload=reload,
-        log_level=log_level,
-        access_log=True
-    )
+    if reload:
+        # Development: single auto-reloading process
+        uvicorn.run(
+            "app.main:app",
+            host=host,
+            port=port,
+            reload=reload,
+            log_level=log_level,
+            access_log=True
+        )
+    else:
+        # Production: one uvloop/httptools process per worker, no access log.
+        # The schema and default documents are set up once, before the
+        # workers start, instead of concurrently in each of them.
+        workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+        if workers > 1:
+            from app.main import prepare_workers
+            prepare_workers()
+        uvicorn.run(
+            "app.main:app",
+            host=host,
+            port=port,
+            loop="uvloop",
+            http="httptools",
+            workers=workers,
+            log_level=log_level,
+            access_log=False
+        )
 
 if __name__ == "__main__":
     main()
@@ -5,71 +5,111 @@ Sample Data Initialization Script
 This script creates sample borrowers, loans, and other data for testing the debt recovery system.
 """
 
+import asyncio
+import csv
+import io
 import sys
 import os
 from datetime import datetime, timedelta
-from decimal import Decimal
+from typing import NamedTuple
 
 # Add the app directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
 
+from sqlalchemy import exists, insert
 from sqlalchemy.orm import Session
-from app.models.database import SessionLocal, create_tables
+from app.models.database import SyncSessionLocal, create_tables
 from app.models.schemas import (
     Borrower, Loan, Transaction, ConsentStatus, LoanStatus, TransactionType
 )
-from app.services.rag_service import rag_service
+from app.services.rag_service import get_rag_service
+
+
+class BorrowerSeed(NamedTuple):
+    name: str
+    email: str
+    phone: str
+    address: str
+    ssn_last_four: str
+    consent_status: ConsentStatus
+    preferred_contact_method: str
+
+
+# Sample borrowers, defined once; loans are derived per run (borrower ids, dates)
+BORROWER_SEEDS = (
+    BorrowerSeed(
+        name="John Smith",
+        email="john.smith@email.com",
+        phone="+1-555-0101",
+        address="123 Main St, Anytown, ST 12345",
+        ssn_last_four="1234",
+        consent_status=ConsentStatus.GRANTED,
+        preferred_contact_method="email"
+    ),
+    BorrowerSeed(
+        name="Sarah Johnson",
+        email="sarah.johnson@email.com",
+        phone="+1-555-0102",
+        address="456 Oak Ave, Somewhere, ST 67890",
+        ssn_last_four="5678",
+        consent_status=ConsentStatus.GRANTED,
+        preferred_contact_method="sms"
+    ),
+    BorrowerSeed(
+        name="Michael Brown",
+        email="michael.brown@email.com",
+        phone="+1-555-0103",
+        address="789 Pine Rd, Elsewhere, ST 11111",
+        ssn_last_four="9012",
+        consent_status=ConsentStatus.PENDING,
+        preferred_contact_method="phone"
+    ),
+    BorrowerSeed(
+        name="Emily Davis",
+        email="emily.davis@email.com",
+        phone="+1-555-0104",
+        address="321 Elm St, Nowhere, ST 22222",
+        ssn_last_four="3456",
+        consent_status=ConsentStatus.REVOKED,
+        preferred_contact_method="email"
+    )
+)
+
+
+# Borrower profile document; filled with str.format per borrower/loan pair
+PROFILE_TEMPLATE = """
+        Borrower Profile: {borrower.name}
+        Account: {loan.account_number}
+        
+        Contact Information:
+        - Email: {borrower.email}
+        - Phone: {borrower.phone}
+        - Preferred Contact: {borrower.preferred_contact_method}
+        
+        Account Details:
+        - Original Amount: ${loan.principal_amount:.2f}
+        - Current Balance: ${loan.current_balance:.2f}
+        - Status: {loan.status.value}
+        - Days Overdue: {loan.days_overdue}
+        
+        Payment History:
+        - Last Payment: ${loan.last_payment_amount:.2f} on {last_payment_date}
+        
+        Notes:
+        - Borrower has been responsive to previous communications
+        - Prefers {borrower.preferred_contact_method} contact method
+        - Account shows history of partial payments
+        """
 
 
 def create_sample_borrowers(db: Session):
     """Create sample borrowers for testing"""
     
-    borrowers_data = [
-        {
-            "name": "John Smith",
-            "email": "john.smith@email.com",
-            "phone": "+1-555-0101",
-            "address": "123 Main St, Anytown, ST 12345",
-            "ssn_last_four": "1234",
-            "consent_status": ConsentStatus.GRANTED,
-            "preferred_contact_method": "email"
-        },
-        {
-            "name": "Sarah Johnson",
-            "email": "sarah.johnson@email.com", 
-            "phone": "+1-555-0102",
-            "address": "456 Oak Ave, Somewhere, ST 67890",
-            "ssn_last_four": "5678",
-            "consent_status": ConsentStatus.GRANTED,
-            "preferred_contact_method": "sms"
-        },
-        {
-            "name": "Michael Brown",
-            "email": "michael.brown@email.com",
-            "phone": "+1-555-0103", 
-            "address": "789 Pine Rd, Elsewhere, ST 11111",
-            "ssn_last_four": "9012",
-            "consent_status": ConsentStatus.PENDING,
-            "preferred_contact_method": "phone"
-        },
-        {
-            "name": "Emily Davis",
-            "email": "emily.davis@email.com",
-            "phone": "+1-555-0104",
-            "address": "321 Elm St, Nowhere, ST 22222", 
-            "ssn_last_four": "3456",
-            "consent_status": ConsentStatus.REVOKED,
-            "preferred_contact_method": "email"
-        }
-    ]
-    
-    borrowers = []
-    for data in borrowers_data:
-        borrower = Borrower(**data)
-        db.add(borrower)
-        borrowers.append(borrower)
-    
-    db.flush()  # Get IDs
+    # One bulk INSERT; RETURNING gives back the rows (with IDs) in input order
+    borrowers = db.scalars(
+        insert(Borrower).returning(Borrower, sort_by_parameter_order=True),
+        [seed._asdict() for seed in BORROWER_SEEDS]
+    ).all()
     print(f"Created {len(borrowers)} sample borrowers")
     return borrowers
 
@@ -77,6 +117,7 @@ def create_sample_borrowers(db: Session):
 def create_sample_loans(db: Session, borrowers):
     """Create sample loans for the borrowers"""
     
+    now = datetime.now()
     loans_data = [
         {
             "borrower_id": borrowers[0].id,
@@ -84,9 +125,9 @@ def create_sample_loans(db: Session, borrowers):
             "principal_amount": 1500.00,
             "current_balance": 1200.00,
             "interest_rate": 0.18,
-            "origination_date": datetime.now() - timedelta(days=365),
-            "due_date": datetime.now() - timedelta(days=90),
-            "last_payment_date": datetime.now() - timedelta(days=120),
+            "origination_date": now - timedelta(days=365),
+            "due_date": now - timedelta(days=90),
+            "last_payment_date": now - timedelta(days=120),
             "last_payment_amount": 300.00,
             "status": LoanStatus.OVERDUE,
             "days_overdue": 90
@@ -97,9 +138,9 @@ def create_sample_loans(db: Session, borrowers):
             "principal_amount": 2500.00,
             "current_balance": 2800.00,
             "interest_rate": 0.22,
-            "origination_date": datetime.now() - timedelta(days=200),
-            "due_date": datetime.now() - timedelta(days=45),
-            "last_payment_date": datetime.now() - timedelta(days=60),
+            "origination_date": now - timedelta(days=200),
+            "due_date": now - timedelta(days=45),
+            "last_payment_date": now - timedelta(days=60),
             "last_payment_amount": 150.00,
             "status": LoanStatus.OVERDUE,
             "days_overdue": 45
@@ -110,9 +151,9 @@ def create_sample_loans(db: Session, borrowers):
             "principal_amount": 800.00,
             "current_balance": 950.00,
             "interest_rate": 0.15,
-            "origination_date": datetime.now() - timedelta(days=180),
-            "due_date": datetime.now() - timedelta(days=30),
-            "last_payment_date": datetime.now() - timedelta(days=45),
+            "origination_date": now - timedelta(days=180),
+            "due_date": now - timedelta(days=30),
+            "last_payment_date": now - timedelta(days=45),
             "last_payment_amount": 100.00,
             "status": LoanStatus.OVERDUE,
             "days_overdue": 30
@@ -123,22 +164,19 @@ def create_sample_loans(db: Session, borrowers):
             "principal_amount": 3000.00,
             "current_balance": 0.00,
             "interest_rate": 0.20,
-            "origination_date": datetime.now() - timedelta(days=400),
-            "due_date": datetime.now() - timedelta(days=30),
-            "last_payment_date": datetime.now() - timedelta(days=10),
+            "origination_date": now - timedelta(days=400),
+            "due_date": now - timedelta(days=30),
+            "last_payment_date": now - timedelta(days=10),
             "last_payment_amount": 3200.00,
             "status": LoanStatus.PAID,
             "days_overdue": 0
         }
     ]
     
-    loans = []
-    for data in loans_data:
-        loan = Loan(**data)
-        db.add(loan)
-        loans.append(loan)
-    
-    db.flush()  # Get IDs
+    loans = db.scalars(
+        insert(Loan).returning(Loan, sort_by_parameter_order=True),
+        loans_data
+    ).all()
     print(f"Created {len(loans)} sample loans")
     return loans
 
@@ -161,87 +199,100 @@ def create_sample_transactions(db: Session, loans):
             
             payment_amounts = [500.00, 800.00, 700.00, 1200.00]
             
-            for date, amount in zip(payment_dates, payment_amounts):
-                transaction = Transaction(
-                    loan_id=loan.id,
-                    transaction_id=f"TXN_{loan.account_number}_{len(transactions)+1:03d}",
-                    amount=amount,
-                    transaction_type=TransactionType.PAYMENT,
-                    description=f"Payment for account {loan.account_number}",
-                    payment_method="credit_card",
-                    processed_at=date
-                )
-                db.add(transaction)
-                transactions.append(transaction)
+            for number, (date, amount) in enumerate(zip(payment_dates, payment_amounts), 1):
+                transactions.append({
+                    "loan_id": loan.id,
+                    "transaction_id": f"TXN_{loan.account_number}_{number:03d}",
+                    "amount": amount,
+                    "transaction_type": TransactionType.PAYMENT,
+                    "description": f"Payment for account {loan.account_number}",
+                    "payment_method": "credit_card",
+                    "processed_at": date
+                })
         
         else:
             # Overdue loan - create some payment history
             if loan.last_payment_date:
-                transaction = Transaction(
-                    loan_id=loan.id,
-                    transaction_id=f"TXN_{loan.account_number}_001",
-                    amount=loan.last_payment_amount,
-                    transaction_type=TransactionType.PAYMENT,
-                    description=f"Last payment for account {loan.account_number}",
-                    payment_method="bank_transfer",
-                    processed_at=loan.last_payment_date
-                )
-                db.add(transaction)
-                transactions.append(transaction)
+                transactions.append({
+                    "loan_id": loan.id,
+                    "transaction_id": f"TXN_{loan.account_number}_001",
+                    "amount": loan.last_payment_amount,
+                    "transaction_type": TransactionType.PAYMENT,
+                    "description": f"Last payment for account {loan.account_number}",
+                    "payment_method": "bank_transfer",
+                    "processed_at": loan.last_payment_date
+                })
             
             # Add some fees
-            fee_transaction = Transaction(
-                loan_id=loan.id,
-                transaction_id=f"TXN_{loan.account_number}_FEE",
-                amount=25.00,
-                transaction_type=TransactionType.FEE,
-                description="Late payment fee",
-                processed_at=loan.due_date + timedelta(days=15)
-            )
-            db.add(fee_transaction)
-            transactions.append(fee_transaction)
+            transactions.append({
+                "loan_id": loan.id,
+                "transaction_id": f"TXN_{loan.account_number}_FEE",
+                "amount": 25.00,
+                "transaction_type": TransactionType.FEE,
+                "description": "Late payment fee",
+                "processed_at": loan.due_date + timedelta(days=15)
+            })
     
+    insert_transactions(db, transactions)
     print(f"Created {len(transactions)} sample transactions")
     return transactions
 
 
+def insert_transactions(db: Session, transactions):
+    """Insert transaction mappings: COPY on PostgreSQL, one executemany INSERT elsewhere"""
+    
+    if db.get_bind().dialect.name != "postgresql":
+        db.execute(insert(Transaction), transactions)
+        return
+    
+    # CSV rows for COPY ... FROM STDIN; the enum column takes member names
+    # (as SQLAlchemy stores them) and an empty unquoted field is NULL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for transaction in transactions:
+        writer.writerow([
+            transaction["loan_id"],
+            transaction["transaction_id"],
+            transaction["amount"],
+            transaction["transaction_type"].name,
+            transaction["description"],
+            transaction.get("payment_method"),
+            transaction["processed_at"].isoformat()
+        ])
+    buffer.seek(0)
+    
+    # Same connection (and transaction) as the session, so main() still commits once
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY transactions (loan_id, transaction_id, amount, transaction_type, "
+            "description, payment_method, processed_at) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
 def create_sample_rag_documents(borrowers, loans):
     """Create sample documents for the RAG system"""
     
+    # Collected across profiles and communications, then embedded and
+    # indexed in one add_documents call
+    documents = []
+    
     # Add borrower profile documents
-    for i, (borrower, loan) in enumerate(zip(borrowers, loans)):
-        profile_content = f"""
-        Borrower Profile: {borrower.name}
-        Account: {loan.account_number}
-        
-        Contact Information:
-        - Email: {borrower.email}
-        - Phone: {borrower.phone}
-        - Preferred Contact: {borrower.preferred_contact_method}
-        
-        Account Details:
-        - Original Amount: ${loan.principal_amount:.2f}
-        - Current Balance: ${loan.current_balance:.2f}
-        - Status: {loan.status.value}
-        - Days Overdue: {loan.days_overdue}
-        
-        Payment History:
-        - Last Payment: ${loan.last_payment_amount:.2f} on {loan.last_payment_date.strftime('%Y-%m-%d') if loan.last_payment_date else 'N/A'}
-        
-        Notes:
-        - Borrower has been responsive to previous communications
-        - Prefers {borrower.preferred_contact_method} contact method
-        - Account shows history of partial payments
-        """
-        
-        rag_service.add_document(
-            content=profile_content,
-            document_type="borrower_profile",
-            source=f"profile_{borrower.id}",
-            title=f"Profile for {borrower.name}",
-            loan_id=loan.id,
-            borrower_id=borrower.id
-        )
+    documents.extend(
+        {
+            "content": PROFILE_TEMPLATE.format(
+                borrower=borrower,
+                loan=loan,
+                last_payment_date=loan.last_payment_date.strftime('%Y-%m-%d') if loan.last_payment_date else 'N/A'
+            ),
+            "document_type": "borrower_profile",
+            "source": f"profile_{borrower.id}",
+            "title": f"Profile for {borrower.name}",
+            "loan_id": loan.id,
+            "borrower_id": borrower.id
+        }
+        for borrower, loan in zip(borrowers, loans)
+    )
     
     # Add communication history documents
     communication_examples = [
@@ -280,14 +331,16 @@ def create_sample_rag_documents(borrowers, loans):
     ]
     
     for comm in communication_examples:
-        rag_service.add_document(
-            content=comm["content"],
-            document_type="communication",
-            source="previous_communications",
-            title="Communication History",
-            loan_id=comm["loan_id"],
-            borrower_id=comm["borrower_id"]
-        )
+        documents.append({
+            "content": comm["content"],
+            "document_type": "communication",
+            "source": "previous_communications",
+            "title": "Communication History",
+            "loan_id": comm["loan_id"],
+            "borrower_id": comm["borrower_id"]
+        })
+    
+    get_rag_service().add_documents(documents)
     
     print("Created sample RAG documents")
 
@@ -298,15 +351,16 @@ def main():
     print("Initializing sample data for AI Debt Recovery Agent...")
     
     # Create database tables
-    create_tables()
+    asyncio.run(create_tables())
     
     # Create database session
-    db = SessionLocal()
+    db = SyncSessionLocal()
     
     try:
-        # Check if data already exists
-        existing_borrowers = db.query(Borrower).count()
-        if existing_borrowers > 0:
+        # Check if data already exists (EXISTS stops at the first row; the
+        # count is only taken for the message when there is data)
+        if db.query(exists().where(Borrower.id.isnot(None))).scalar():
+            existing_borrowers = db.query(Borrower).count()
             print(f"Sample data already exists ({existing_borrowers} borrowers found)")
             print("Skipping data creation. Use --force to recreate.")
             return
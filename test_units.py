@@ -0,0 +1,274 @@
+"""
+Unit Tests
+
+Offline checks of helpers that need no server, database, LLM or embedding
+model: response JSON extraction, the vector metadata store, text chunking,
+contact frequency counting, the identity verification UPDATE and month
+arithmetic. Run with: pytest test_units.py
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.schemas import Borrower, Conversation, ConversationState, Loan
+from app.services.compliance_service import compliance_service
+from app.services.conversation_service import ConversationService
+from app.services.llm_service import _extract_response_json, _find_json_span
+from app.services.metadata_store import DocumentMetadataStore
+from app.services.rag_service import RAGService
+
+
+def _compile(statement) -> tuple:
+    compiled = statement.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+class _Result:
+    def __init__(self, row=None, scalar=None):
+        self._row = row
+        self._scalar = scalar
+
+    def first(self):
+        return self._row
+
+    def scalar_one_or_none(self):
+        return self._scalar
+
+
+class _RecordingSession:
+    """Async session stand-in that records statements and replays results"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return self.results.pop(0) if self.results else _Result()
+
+    async def commit(self):
+        self.commits += 1
+
+
+# Response JSON extraction
+
+def test_find_json_span_skips_braces_in_strings():
+    text = 'Reply: {"message_to_user": "use {braces} and \\"quotes\\"", "plan": {"amount": 1}} tail'
+    start, end = _find_json_span(text)
+    assert text[start:end].startswith('{"message_to_user"')
+    assert text[end:] == " tail"
+
+
+def test_find_json_span_incomplete_object():
+    assert _find_json_span('{"action": "inform"') is None
+    assert _find_json_span("no object here") is None
+
+
+def test_extract_response_json_prefers_fenced_block():
+    text = (
+        'Example: {"action": "close"}\n'
+        '```json\n{"action": "inform", "message_to_user": "Hi", "confidence": 0.9}\n```'
+    )
+    assert _extract_response_json(text)["action"] == "inform"
+
+
+def test_extract_response_json_skips_objects_without_action():
+    text = '{"note": "context"} then {"action": "escalate", "structured_plan": {"type": "settlement"}}'
+    parsed = _extract_response_json(text)
+    assert parsed["action"] == "escalate"
+    assert parsed["structured_plan"] == {"type": "settlement"}
+    assert _extract_response_json('{"note": "no action"}') is None
+
+
+# Vector metadata store
+
+def _record(document_id: str, loan_id=None, document_type="policy") -> dict:
+    return {"document_id": document_id, "document_type": document_type,
+            "content": f"content of {document_id}", "loan_id": loan_id}
+
+
+def _vectors(*values: float) -> np.ndarray:
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def test_metadata_store_append_and_read(tmp_path):
+    store = DocumentMetadataStore(str(tmp_path / "index"), 4)
+    store.open(0, 0)
+    with store.writer():
+        store.append([_record("a", loan_id=7), None, _record("c", document_type="regulation")],
+                     _vectors(1, 2, 3))
+
+    # Appended rows only become visible once the view is extended
+    assert len(store) == 0
+    assert store.extend() == 0
+    assert len(store) == 3
+    assert store.get(0)["document_id"] == "a"
+    assert store.get(1) is None
+    assert store.get(3) is None
+    assert list(store.columns["loan_id"]) == [7, -1, -1]
+    assert store.doc_type_codes == {"policy": 0, "regulation": 1}
+    assert store.vectors[2, 0] == 3
+
+
+def test_metadata_store_replays_rows_from_other_writers(tmp_path):
+    path = str(tmp_path / "index")
+    first, second = DocumentMetadataStore(path, 4), DocumentMetadataStore(path, 4)
+    first.open(0, 0)
+    second.open(0, 0)
+    with first.writer():
+        first.append([_record("a")], _vectors(1))
+    with second.writer():
+        second.append([_record("b")], _vectors(2))
+
+    assert first.extend() == 0
+    assert [first.get(i)["document_id"] for i in range(len(first))] == ["a", "b"]
+    assert list(first.vectors[:, 0]) == [1, 2]
+
+
+def test_metadata_store_view_is_bounded(tmp_path):
+    store = DocumentMetadataStore(str(tmp_path / "index"), 4)
+    with store.writer():
+        store.append([_record("a"), _record("b")], _vectors(1, 2))
+
+    store.open(0, 1)
+    assert len(store) == 1
+    assert store.get(1) is None
+
+
+def test_metadata_store_publish_keeps_old_view_readable(tmp_path):
+    path = str(tmp_path / "index")
+    store = DocumentMetadataStore(path, 4)
+    with store.writer():
+        store.append([_record("old")], _vectors(1))
+    store.open(0, 1)
+
+    for _ in range(2):
+        with store.writer():
+            staged = store.new_generation()
+            staged.append([_record("new")], _vectors(2))
+            store.publish(staged)
+
+    # Generation 0 is unlinked by the second publish; the mapping survives
+    assert store.current_generation() == 2
+    assert not (tmp_path / "index.0.columns").exists()
+    assert store.get(0)["document_id"] == "old"
+
+    fresh = DocumentMetadataStore(path, 4)
+    fresh.open(2, fresh.disk_rows(2))
+    assert fresh.get(0)["document_id"] == "new"
+
+
+# Text chunking
+
+def test_chunk_text_overlapping_windows():
+    text = " ".join(f"w{i}" for i in range(10))
+    assert RAGService._chunk_text(text, 4, 1) == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_chunk_text_normalizes_whitespace():
+    assert RAGService._chunk_text("  one\n\ttwo   three ", 10, 2) == ["one two three"]
+    assert RAGService._chunk_text(" \n ", 10, 2) == []
+
+
+# Contact frequency
+
+def test_contact_frequency_counts_rolling_windows():
+    now = datetime.now()
+    today_start = datetime.combine(now.date(), time.min)
+    borrower = Borrower(recent_contact_times=[
+        now,
+        today_start - timedelta(hours=1),  # yesterday, inside the week
+        now - timedelta(days=6, hours=23),
+        now - timedelta(days=8)
+    ])
+    daily, weekly = compliance_service._get_contact_frequency_counters(borrower)
+    assert (daily, weekly) == (1, 3)
+
+
+def test_contact_frequency_without_contacts():
+    assert compliance_service._get_contact_frequency_counters(Borrower()) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_record_contact_keeps_newest_times():
+    db = _RecordingSession()
+    await compliance_service.record_contact(42, db)
+
+    sql, params = _compile(db.statements[0])
+    assert "array_prepend" in sql
+    assert params["id_1"] == 42
+    # Postgres array slices are 1-based and inclusive
+    assert (params["param_1"], params["param_2"]) == (1, compliance_service._recent_contacts_kept)
+
+
+# Identity verification
+
+def _verification_row():
+    conversation = Conversation(id=5, conversation_id="session-5", loan_id=9,
+                                verification_attempts=0)
+    loan = Loan(id=9, last_payment_amount=300.0)
+    borrower = Borrower(id=3, ssn_last_four="1234")
+    return _Result(row=(conversation, loan, borrower))
+
+
+@pytest.mark.asyncio
+async def test_verify_identity_guards_attempts_in_update():
+    service = ConversationService()
+    db = _RecordingSession(_verification_row(), _Result(scalar=1))
+    result = await service.verify_identity(
+        "session-5", {"last_four_ssn": "1234", "last_payment_amount": "300.00"}, db
+    )
+    assert result == {"verified": True, "message": "Identity verified successfully.",
+                      "attempts_remaining": service.max_verification_attempts - 1}
+
+    sql, params = _compile(db.statements[1])
+    # Incremented in SQL, and only while under the limit
+    assert "verification_attempts=(conversations.verification_attempts + %(verification_attempts_1)s)" in sql
+    assert "conversations.verification_attempts < %(verification_attempts_2)s" in sql
+    assert params["verification_attempts_1"] == 1
+    assert params["verification_attempts_2"] == service.max_verification_attempts
+    assert params["identity_verified"] is True
+    assert params["state"] == ConversationState.ACTIVE_NEGOTIATION
+
+
+@pytest.mark.asyncio
+async def test_verify_identity_failure_only_counts_attempt():
+    service = ConversationService()
+    db = _RecordingSession(_verification_row(), _Result(scalar=2))
+    result = await service.verify_identity("session-5", {"last_four_ssn": "9999"}, db)
+    assert result["verified"] is False
+    assert result["attempts_remaining"] == service.max_verification_attempts - 2
+
+    _, params = _compile(db.statements[1])
+    assert "identity_verified" not in params
+    assert "state" not in params
+
+
+@pytest.mark.asyncio
+async def test_verify_identity_escalates_when_update_matches_nothing():
+    service = ConversationService()
+    row = _verification_row()
+    conversation = row.first()[0]
+    db = _RecordingSession(row, _Result(scalar=None))
+    result = await service.verify_identity("session-5", {"last_four_ssn": "1234"}, db)
+    assert result["attempts_remaining"] == 0
+    assert conversation.state == ConversationState.ESCALATED
+    assert db.commits == 1
+
+
+# Month arithmetic
+
+@pytest.mark.parametrize("start, months, expected", [
+    (datetime(2024, 1, 31), 1, datetime(2024, 2, 29)),
+    (datetime(2023, 1, 31), 1, datetime(2023, 2, 28)),
+    (datetime(2024, 3, 31), 1, datetime(2024, 4, 30)),
+    (datetime(2024, 11, 15, 9, 30), 3, datetime(2025, 2, 15, 9, 30)),
+    (datetime(2024, 12, 1), 12, datetime(2025, 12, 1)),
+    (datetime(2024, 5, 20), 0, datetime(2024, 5, 20)),
+])
+def test_add_months(start, months, expected):
+    assert ConversationService._add_months(start, months) == expected